@@ -1,8 +1,28 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "shared"))
+import cli
+import stage_profiler
+import report_rendering
+from cost_frame import CostFrame, read_cost_rows, write_parquet_parts
+from cost_ingest import DEFAULT_CHUNKSIZE, iter_series_frames
+from holtwinters_batch import SEASONAL_PERIODS, fit_batch, holt_winters_filter
+from residual_thresholds import DEFAULT_SIGMA, THRESHOLD_STRATEGIES, ResidualMatrix, score_residuals
+from holtwinters_state import (
+    DRIFT_THRESHOLD, HISTORY_COLUMNS, KEY_COLUMNS, REFIT_EVERY_DAYS, HoltWintersStateStore, state_from_model,
+    update_states
+)
+from series_calendar import GAP_POLICIES, SeriesCalendar
+from anomaly_store import AnomalyScoreStore
 
 # ---------- Settings ----------
 pd.set_option("display.max_columns", None)
@@ -19,137 +39,617 @@ AWS_PRODUCTS = ["EC2", "S3", "RDS", "Lambda", "DynamoDB", "CloudFront", "SNS", "
 
 # ---------- Dummy Data Generator ----------
 class DummyDataGenerator:
-    def __init__(self, apps, products, days=120, seed=42):
-        self.apps = apps
-        self.products = products
+    """
+    Daily costs per application × product: base level + sinusoidal seasonality
+    + noise, with 25-39 injected spikes and drops per series.
+
+    Every chunk of applications is built as one (series × days) array from a
+    local np.random.Generator. The data depends on the seed and on
+    apps_per_chunk (one chunk by default).
+    """
+
+    def __init__(self, apps, products, days=120, seed=42, start="2023-01-01"):
+        self.apps = list(apps)
+        self.products = list(products)
         self.days = days
-        np.random.seed(seed)
+        self.seed = seed
+        self.start = start
+
+    @classmethod
+    def at_scale(cls, n_apps, n_products, days=365, seed=42):
+        """Synthetic names for load tests, e.g. at_scale(5000, 200, 365)."""
+        apps = [f"App{i:05d}" for i in range(n_apps)]
+        products = [f"Product{j:03d}" for j in range(n_products)]
+        return cls(apps, products, days=days, seed=seed)
+
+    def _values(self, rng, n_series):
+        base = rng.uniform(80, 120, (n_series, 1))
+        seasonal = 10 * np.sin(np.linspace(0, 3 * np.pi, self.days))
+        noise = rng.normal(0, 3, (n_series, self.days))
+        values = base + seasonal + noise
+
+        # Inject **more anomalies** (spikes and drops): the n_anoms days with the
+        # smallest random keys of each series, i.e. n_anoms days without replacement
+        n_anoms = np.minimum(rng.integers(25, 40, n_series), self.days)  # increase number of anomalies
+        keys = rng.random((n_series, self.days))
+        kth_key = np.sort(keys, axis=1)[np.arange(n_series), n_anoms - 1]
+        hit = keys <= kth_key[:, None]
+        sign = np.where(rng.random((n_series, self.days)) > 0.5, 1.0, -1.0)  # bigger spikes or drops
+        values += np.where(hit, sign * rng.uniform(50, 150, (n_series, self.days)), 0.0)
+        return values
+
+    def iter_chunks(self, apps_per_chunk=None, cost_dtype=np.float64):
+        """Yield one CostFrame per `apps_per_chunk` applications (codes index all apps)."""
+        rng = np.random.default_rng(self.seed)
+        apps_per_chunk = apps_per_chunk or max(len(self.apps), 1)
+        n_products = len(self.products)
+        dates = pd.date_range(start=self.start, periods=self.days, freq="D").to_numpy()
+        for first in range(0, len(self.apps), apps_per_chunk):
+            n_apps = min(apps_per_chunk, len(self.apps) - first)
+            values = self._values(rng, n_apps * n_products)
+            yield CostFrame(
+                app_codes=np.repeat(np.arange(first, first + n_apps, dtype=np.int32), n_products * self.days),
+                product_codes=np.tile(np.repeat(np.arange(n_products, dtype=np.int32), self.days), n_apps),
+                costs=values.ravel().astype(cost_dtype, copy=False),
+                applications=self.apps,
+                products=self.products,
+                dates=np.tile(dates, n_apps * n_products)
+            )
+
+    def to_parquet(self, directory, apps_per_chunk=250, cost_dtype=np.float32):
+        """Write the dataset as Parquet part files without holding it in memory."""
+        return write_parquet_parts(self.iter_chunks(apps_per_chunk, cost_dtype), directory)
 
     def generate(self):
-        dates = pd.date_range(start="2023-01-01", periods=self.days, freq="D")
-        data = []
-        for app in self.apps:
-            for prod in self.products:
-                base = np.random.uniform(80, 120)
-                seasonal = 10 * np.sin(np.linspace(0, 3 * np.pi, self.days))
-                noise = np.random.normal(0, 3, self.days)
-                values = base + seasonal + noise
-
-                # Inject **more anomalies** (spikes and drops)
-                n_anoms = np.random.randint(25, 40)  # increase number of anomalies
-                idx = np.random.choice(self.days, n_anoms, replace=False)
-                for i in idx:
-                    if np.random.rand() > 0.5:
-                        values[i] += np.random.uniform(50, 150)  # bigger spikes
-                    else:
-                        values[i] -= np.random.uniform(50, 150)  # bigger drops
-
-                for d, v in zip(dates, values):
-                    data.append([app, prod, d, v])
-        return pd.DataFrame(data, columns=["application_name", "product_name", "date", "eur_total_costs"])
+        frames = [chunk.to_pandas() for chunk in self.iter_chunks()]
+        if not frames:
+            return pd.DataFrame(columns=["application_name", "product_name", "date", "eur_total_costs"])
+        df = pd.concat(frames, ignore_index=True)
+        return df.astype({"application_name": object, "product_name": object})
 
 # ---------- Holt-Winters Anomaly Detector ----------
-def detect_anomalies_holtwinters(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    anomalies = []
+MIN_SERIES_LENGTH = 42  # 6 weekly seasons, the minimum for a stable fit
+DEFAULT_CHUNK_SIZE = 64  # series per task sent to a worker process
+REFIT_HISTORY_DAYS = 112  # incremental mode: days of cost rows kept per series for refits (16 seasons)
+STREAM_BATCH_SERIES = 256  # streaming mode: completed series scored per detector call
+ENGINES = ("statsmodels", "batch")
 
-    for (app, product), group in df.groupby(['application_name', 'product_name']):
-        series = group.set_index('date')['eur_total_costs'].asfreq('D').fillna(0.0)
-        if len(series) < 42:
-            continue
 
-        try:
-            model = ExponentialSmoothing(
-                series,
-                seasonal='add',
-                seasonal_periods=7,
-                trend='add',
-                initialization_method="estimated"
-            ).fit()
-            
-            fitted = model.fittedvalues
-            resid = series - fitted
-
-            """"
-            --- Standard deviation rule (default) ---
-            Good when data is roughly normal. Raise σ to reduce false positives.
-            threshold = sigma * resid.std()
-            return np.abs(resid) > threshold
-
-            --- Median Absolute Deviation ---
-            Use when residuals contain large spikes (outliers).
-            MAD is more stable because a single big anomaly won't inflate it.
-            median = np.median(resid)
-            mad = np.median(np.abs(resid - median))
-            threshold = sigma * mad
-            return np.abs(resid - median) > threshold
-
-            --- Quantile thresholds ---
-            Use when data is skewed (not symmetric) or heavy-tailed.
-            Consider when this is used that even quartile outliers need to be detected!
-            Flags values outside the (1 - quantile, quantile) range.
-            lower, upper = np.quantile(resid, [1-quantile, quantile])
-            return (resid < lower) | (resid > upper)
-            
-            Different anomaly methods could be used for different cases, simple right? 
-            """
-
-            threshold = 2 * resid.std()
-            anomaly_score = resid / threshold
-            anomaly_score = anomaly_score.where(anomaly_score.abs() > 0.8, 0.0)
-
-            result = pd.DataFrame({
-                'application_name': app,
-                'product_name': product,
-                'date': series.index,
-                'anomaly_score': anomaly_score.values
-            })
-            anomalies.append(result)
+def _fit_series(app, product, series: pd.Series, keep_state=False):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # loaded by the first statsmodels fit
+    model = ExponentialSmoothing(
+        series,
+        seasonal='add',
+        seasonal_periods=SEASONAL_PERIODS,
+        trend='add',
+        initialization_method="estimated"
+    ).fit()
+
+    resid = (series - model.fittedvalues).to_numpy()
+    state = None
+    if keep_state:
+        threshold = DEFAULT_SIGMA * np.std(resid, ddof=1)
+        state = state_from_model(app, product, model, series, threshold)
+    return app, product, series.index.to_numpy(), resid, state
 
+
+def _fit_chunk(chunk, keep_state=False, timed=False):
+    """
+    Fit a list of (app, product, series); failures are returned, not raised.
+    With `timed`, the fit time of every series is returned too, since worker
+    processes cannot report to the parent's profiler themselves.
+    """
+    results, failures, timings = [], [], []
+    for app, product, series in chunk:
+        start = time.perf_counter() if timed else 0.0
+        try:
+            results.append(_fit_series(app, product, series, keep_state))
         except Exception as e:
-            print(f"Holt-Winters failed for {app} × {product}: {e}")
-            continue
+            failures.append((app, product, str(e)))
+        if timed:
+            timings.append((f"{app} × {product}", time.perf_counter() - start))
+    return results, failures, timings
+
+
+def _with_dates(df) -> pd.DataFrame:
+    """
+    Accept a DataFrame or a CostFrame, and parse the date column only when
+    needed, without copying the whole frame.
+    """
+    with stage_profiler.stage("date_parsing"):
+        if isinstance(df, CostFrame):
+            return df.to_pandas()  # categorical names, datetime64 dates
+        if pd.api.types.is_datetime64_any_dtype(df['date']):
+            return df
+        return df.assign(date=pd.to_datetime(df['date']))
+
+
+def _series_calendar(df, gap_policy="zero") -> SeriesCalendar:
+    """All series long enough to fit, on one daily calendar (see series_calendar.py)."""
+    with stage_profiler.stage("series_prep"):
+        calendar = SeriesCalendar.from_frame(df, gap_policy)
+        return calendar.select(calendar.lengths >= MIN_SERIES_LENGTH)
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _resolve_n_jobs(n_jobs) -> int:
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def _run_chunks(series, n_jobs, chunk_size, keep_state=False):
+    """Fit (app, product, series) triples serially or on a process pool, in order."""
+    fit_chunk = partial(_fit_chunk, keep_state=keep_state, timed=stage_profiler.active() is not None)
+    n_jobs = _resolve_n_jobs(n_jobs)
+    if n_jobs == 1:
+        outcomes = map(fit_chunk, _chunked(series, chunk_size))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=n_jobs)
+        outcomes = executor.map(fit_chunk, _chunked(series, chunk_size))
+
+    fitted = []
+    try:
+        for results, failures, timings in outcomes:
+            for app, product, error in failures:
+                print(f"Holt-Winters failed for {app} × {product}: {error}")
+            for series_name, seconds in timings:
+                stage_profiler.record("holtwinters_fit", seconds)
+                stage_profiler.record_item("holtwinters_fit", series_name, seconds)
+            fitted.extend(results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return fitted
+
+
+def _stack_fitted(calendar: SeriesCalendar, fitted) -> ResidualMatrix:
+    """ResidualMatrix of per-series fit results (series that failed to fit are left out)."""
+    with stage_profiler.stage("stack_residuals"):
+        rows = pd.MultiIndex.from_arrays(
+            [calendar.applications[calendar.app_codes], calendar.products[calendar.product_codes]]
+        ).get_indexer([row[:2] for row in fitted])
+        resid = np.full(calendar.values.shape, np.nan)
+        for row, (*_, series_resid, _) in zip(rows, fitted):
+            resid[row, calendar.first[row]:calendar.last[row] + 1] = series_resid
+        return calendar.residual_matrix(resid, rows)
+
+
+def _fit_batch_residuals(calendar: SeriesCalendar) -> ResidualMatrix:
+    """Fit all series with the batched engine, one 2-D slice of the calendar per span."""
+    resid = np.full(calendar.values.shape, np.nan)
+    for (first, last), rows in calendar.spans().items():
+        values = calendar.values[rows, first:last + 1]
+        with stage_profiler.stage("batch_fit"):
+            fitted, _ = fit_batch(values)
+        resid[rows, first:last + 1] = values - fitted
+    return calendar.residual_matrix(resid)
+
+
+def fit_residuals(df, n_jobs=1, chunk_size=DEFAULT_CHUNK_SIZE, engine="statsmodels",
+                  gap_policy="zero") -> ResidualMatrix:
+    """
+    Fit one Holt-Winters model per application × product and stack the residuals.
+
+    `df` is a long cost DataFrame or a CostFrame (see shared/cost_frame.py). All
+    series are first aligned on one daily calendar; gap_policy says what a day
+    without a cost becomes (one of GAP_POLICIES, see series_calendar.py).
+
+    n_jobs=1 fits the series one after another in this process. Any other value
+    fans the series out over a process pool (None or -1 uses every core), sending
+    `chunk_size` series per task so the pickling overhead stays small next to the
+    fits. Results come back in groupby order either way, so both paths return the
+    same matrix.
+
+    engine="batch" fits all series together with the vectorized engine in
+    holtwinters_batch.py instead of one statsmodels model per series; see
+    check_batch_equivalence for how close the two get.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    calendar = _series_calendar(df, gap_policy)
+    if engine == "batch":
+        return _fit_batch_residuals(calendar)
+    return _stack_fitted(calendar, _run_chunks(calendar.iter_series(), n_jobs, chunk_size))
+
+
+def detect_anomalies_holtwinters(df, n_jobs=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                                 engine="statsmodels", threshold="std", threshold_overrides=None,
+                                 gap_policy="zero", compact=False, **threshold_params) -> pd.DataFrame:
+    """
+    Fit every application × product series and score its residuals.
+
+    See fit_residuals for n_jobs / chunk_size / engine / gap_policy and
+    score_residuals for threshold, threshold_overrides, compact and the sigma /
+    quantile / cutoff parameters.
+    To compare threshold strategies without refitting, call fit_residuals once
+    and score_residuals per strategy.
+    """
+    residuals = fit_residuals(df, n_jobs, chunk_size, engine, gap_policy)
+    with stage_profiler.stage("thresholding"):
+        return score_residuals(residuals, threshold, threshold_overrides, compact=compact, **threshold_params)
+
+
+def iter_anomalies_streaming(path, presorted=False, batch_series=STREAM_BATCH_SERIES,
+                             chunksize=DEFAULT_CHUNKSIZE, **detect_kwargs):
+    """
+    Score a CSV / Parquet cost export that is too large to load in one frame.
+
+    Series are read with cost_ingest.iter_series_frames and handed to
+    detect_anomalies_holtwinters (with `detect_kwargs`) in groups of
+    `batch_series` as soon as they are complete; one anomaly frame is yielded
+    per group. Thresholds are per series, so the grouping does not change the
+    scores, and peak memory is bounded by one read chunk plus one group.
+    """
+    batch = []
+    for _, series in iter_series_frames(path, presorted=presorted, chunksize=chunksize):
+        batch.append(series)
+        if len(batch) >= batch_series:
+            yield detect_anomalies_holtwinters(pd.concat(batch, ignore_index=True), **detect_kwargs)
+            batch = []
+    if batch:
+        yield detect_anomalies_holtwinters(pd.concat(batch, ignore_index=True), **detect_kwargs)
+
+
+def check_batch_equivalence(df: pd.DataFrame, max_series=50, atol=1e-6, min_agreement=0.95) -> dict:
+    """
+    Compare the batched engine against statsmodels on up to `max_series` series.
+
+    Two checks: the batched recursions, fed statsmodels' own fitted parameters and
+    initial states, must reproduce its fitted values within `atol`; and the two
+    engines, each with its own fit, must agree on which days are flagged for at
+    least `min_agreement` of all scored days.
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    calendar = _series_calendar(df)
+    sample = calendar.select(np.arange(min(max_series, len(calendar))))
+
+    max_abs_diff = 0.0
+    for _, _, series in sample.iter_series():
+        model = ExponentialSmoothing(
+            series, seasonal='add', seasonal_periods=SEASONAL_PERIODS, trend='add',
+            initialization_method="estimated"
+        ).fit()
+        params = model.params
+        param = lambda name: np.array([[params[name]]])
+        _, fitted = holt_winters_filter(
+            series.to_numpy(dtype=float)[None, :],
+            param('smoothing_level'), param('smoothing_trend'), param('smoothing_seasonal'),
+            param('initial_level'), param('initial_trend'),
+            np.asarray(params['initial_seasons'], dtype=float)[None, None, :],
+            keep_fitted=True
+        )
+        max_abs_diff = max(max_abs_diff, float(np.abs(fitted[0, 0] - model.fittedvalues.to_numpy()).max()))
+
+    reference = score_residuals(_stack_fitted(sample, _run_chunks(sample.iter_series(), 1, DEFAULT_CHUNK_SIZE)))
+    batch = score_residuals(_fit_batch_residuals(sample))
+    flag_agreement = float(((reference['anomaly_score'] != 0) == (batch['anomaly_score'] != 0)).mean())
+    score_diff = (reference['anomaly_score'] - batch['anomaly_score']).abs()
+
+    return {
+        'n_series': len(sample),
+        'recursion_max_abs_diff': max_abs_diff,
+        'flag_agreement': flag_agreement,
+        'median_abs_score_diff': float(score_diff.median()),
+        'passed': max_abs_diff <= atol and flag_agreement >= min_agreement
+    }
 
-    return pd.concat(anomalies).reset_index(drop=True) if anomalies else pd.DataFrame()
+
+def fit_with_states(df, n_jobs=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Full statsmodels fit that also keeps every series' Holt-Winters state. Returns
+    (anomalies, states indexed by application × product), states None when no
+    series was long enough to fit.
+    """
+    calendar = _series_calendar(df)
+    refitted = _run_chunks(calendar.iter_series(), n_jobs, chunk_size, keep_state=True)
+    if not refitted:
+        return pd.DataFrame(), None
+    # the saved thresholds are std-rule thresholds, so refits are scored the same way
+    result = score_residuals(_stack_fitted(calendar, refitted), "std")
+    return result, pd.DataFrame([row[4] for row in refitted]).set_index(KEY_COLUMNS)
+
+
+def _warm_start(states: pd.DataFrame, new_rows: pd.DataFrame):
+    """Apply the saved recursions to rows dated after each series' last_date."""
+    codes = states.index.get_indexer(pd.MultiIndex.from_frame(new_rows[KEY_COLUMNS]))
+    offsets = (new_rows['date'].to_numpy() - states['last_date'].to_numpy()[codes]) // np.timedelta64(1, 'D')
+
+    # (series × new days) grid; missing days inside a series count as 0.0 like asfreq().fillna(0.0)
+    n_days = np.zeros(len(states), dtype=int)
+    np.maximum.at(n_days, codes, offsets)
+    values = np.full((len(states), n_days.max()), np.nan)
+    values[np.arange(values.shape[1]) < n_days[:, None]] = 0.0
+    values[codes, offsets - 1] = new_rows['eur_total_costs'].to_numpy(dtype=float)
+
+    states, scores = update_states(states, values)
+    series_idx, day_idx = np.nonzero(~np.isnan(values))
+    result = pd.DataFrame({
+        'application_name': states.index.get_level_values(0)[series_idx],
+        'product_name': states.index.get_level_values(1)[series_idx],
+        'date': states['last_date'].to_numpy()[series_idx] + (day_idx + 1) * np.timedelta64(1, 'D'),
+        'anomaly_score': scores[series_idx, day_idx]
+    })
+    states['last_date'] = states['last_date'] + pd.to_timedelta(n_days, unit='D')
+    return states, result
+
+
+def detect_anomalies_incremental(df: pd.DataFrame, state_path, refit_every=REFIT_EVERY_DAYS,
+                                 drift_threshold=DRIFT_THRESHOLD, n_jobs=1,
+                                 chunk_size=DEFAULT_CHUNK_SIZE, history_days=REFIT_HISTORY_DAYS) -> pd.DataFrame:
+    """
+    Score only the days that arrived since the previous run.
+
+    `df` only needs the new days; rows that were already scored are skipped, so
+    passing the full history works as well. The Holt-Winters state of every
+    series and its last `history_days` days of cost rows are kept in
+    `state_path`. Series with a saved state are moved forward over their new
+    days with the smoothing recursions, which costs time proportional to the new
+    rows. A series is refitted on its kept rows when it has no state yet, when
+    its last fit is `refit_every` days old, or when the EWMA of its new
+    residuals passes `drift_threshold` (in units of the anomaly threshold).
+
+    A refit needs MIN_SERIES_LENGTH days: until a new series has them its rows
+    are only collected, and a series that cannot be refitted keeps its warm
+    scores and state; both cases are reported. Returns the scores of the new
+    days only, in the same layout as detect_anomalies_holtwinters.
+    """
+    store = HoltWintersStateStore(state_path)
+    states = store.load()
+    history = store.load_history()
+    df = _with_dates(df)
+    keys = pd.MultiIndex.from_frame(df[KEY_COLUMNS])
+
+    previous = states['last_date'].copy()
+    last_date = previous.reindex(keys).to_numpy(dtype='datetime64[ns]')
+    is_new = np.isnat(last_date) | (df['date'].to_numpy() > last_date)
+    # several rows of one series and day (billing line items) are summed, as SeriesCalendar does
+    new_rows = (df.loc[is_new, HISTORY_COLUMNS].astype({column: object for column in KEY_COLUMNS})
+                .groupby(KEY_COLUMNS + ['date'], sort=False)['eur_total_costs'].sum(min_count=1)
+                .reset_index())
+
+    new_keys = pd.MultiIndex.from_frame(new_rows[KEY_COLUMNS]).unique()
+    known = states.loc[states.index.intersection(new_keys)]
+    refit_keys = new_keys.difference(known.index)
+    warm_scores = None
+    if len(known):
+        warm_rows = new_rows[pd.MultiIndex.from_frame(new_rows[KEY_COLUMNS]).isin(known.index)]
+        with stage_profiler.stage("warm_start"):
+            warm, warm_scores = _warm_start(known, warm_rows)
+        states.loc[warm.index, warm.columns] = warm
+        due = (warm_rows.groupby(KEY_COLUMNS, observed=True)['date'].max().reindex(warm.index)
+               - warm['fitted_on']) >= pd.Timedelta(days=refit_every)
+        drifted = warm['drift'].abs() > drift_threshold
+        refit_keys = refit_keys.append(warm.index[(due | drifted).to_numpy()])
+
+    history = (pd.concat([history, new_rows], ignore_index=True)
+               .drop_duplicates(KEY_COLUMNS + ['date'], keep='last'))
+    anomalies = []
+    refitted = refit_keys[:0]
+    if len(refit_keys):
+        refit_df = history[pd.MultiIndex.from_frame(history[KEY_COLUMNS]).isin(refit_keys)]
+        result, fresh = fit_with_states(refit_df, n_jobs, chunk_size)
+        if fresh is not None:
+            refitted = fresh.index
+            before = previous.reindex(pd.MultiIndex.from_frame(result[KEY_COLUMNS]))
+            anomalies.append(result[before.isna().to_numpy() | (result['date'].to_numpy() > before.to_numpy())])
+            states = pd.concat([states.drop(fresh.index, errors='ignore'), fresh[states.columns]])
+        waiting = refit_keys.difference(refitted).difference(states.index)
+        kept = refit_keys.difference(refitted).intersection(states.index)
+        if len(waiting):
+            print(f"Holt-Winters: {len(waiting)} new series have fewer than {MIN_SERIES_LENGTH} days, "
+                  f"collecting their rows until they can be fitted")
+        if len(kept):
+            print(f"Holt-Winters: {len(kept)} series could not be refitted (fewer than {MIN_SERIES_LENGTH} "
+                  f"kept days or a failed fit), continuing on their saved state")
+    if warm_scores is not None:
+        anomalies.append(warm_scores[~pd.MultiIndex.from_frame(warm_scores[KEY_COLUMNS]).isin(refitted)])
+
+    newest = history.groupby(KEY_COLUMNS, observed=True)['date'].transform('max')
+    store.save(states, history[history['date'] > newest - pd.Timedelta(days=history_days)])
+    if not anomalies:
+        return pd.DataFrame()
+    return (pd.concat(anomalies)
+            .sort_values(KEY_COLUMNS + ['date'])
+            .reset_index(drop=True))
 
 # ---------- Heatmap Visualizer ----------
-def plot_heatmap_last_week(anomalies_df: pd.DataFrame):
+HEATMAP_STYLE = dict(
+    annot=True,
+    cmap="Spectral",  # richer distribution of colors
+    center=0,
+    fmt=".2f",
+    linewidths=0.5,
+    linecolor="gray",
+    cbar_kws={'label': 'Anomaly Strength'},
+    # axis labels for report_rendering.draw_heatmap, the rest goes to sns.heatmap
+    xlabel="AWS Product",
+    ylabel="Application",
+)
+HEATMAP_DAYS = 7
+ANOMALY_STORE_PATH = os.path.join("output", "anomaly_scores.sqlite")  # scores of every run, see anomaly_store.py
+
+
+def default_store_path(input_path=None):
+    """Score store of the dummy data, or one per --input so runs on different data are not mixed."""
+    if input_path is None:
+        return ANOMALY_STORE_PATH
+    name = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    return os.path.join("output", f"anomaly_scores_{name}.sqlite")
+
+
+def _last_scored_date(anomalies):
+    return anomalies.last_date() if isinstance(anomalies, AnomalyScoreStore) else anomalies['date'].max()
+
+
+def heatmap_last_week(anomalies_df, applications=APPLICATIONS, products=AWS_PRODUCTS, last_date=None):
+    """
+    Data behind the heatmap, no plotting involved: the max anomaly score per
+    application × product over the 7 days up to last_date (default: the last
+    scored day), plus the (application × product × day) score array it is taken
+    from (NaN where a day has no score). Returns (pivot, scores, dates).
+
+    anomalies_df is a detect_anomalies_holtwinters frame or an AnomalyScoreStore;
+    a store reads only those 7 days, and the pivot of its latest week comes from
+    the precomputed rolling summary.
+    """
+    latest = _last_scored_date(anomalies_df)
+    last_date = latest if last_date is None else pd.Timestamp(last_date)
+    dates = pd.date_range(end=last_date, periods=HEATMAP_DAYS, freq="D")
+    summary = None
+    if isinstance(anomalies_df, AnomalyScoreStore):
+        last_week = anomalies_df.window(HEATMAP_DAYS, last_date)
+        if last_date == latest and anomalies_df.rolling_days == HEATMAP_DAYS:
+            summary = anomalies_df.rolling_summary()
+    else:
+        last_week = anomalies_df[anomalies_df['date'].between(dates[0], dates[-1])]
+
+    with stage_profiler.stage("heatmap_pivot"):
+        scores = np.full((len(applications), len(products), len(dates)), np.nan)
+        app_idx = pd.Index(applications).get_indexer(last_week['application_name'])
+        product_idx = pd.Index(products).get_indexer(last_week['product_name'])
+        day_idx = (last_week['date'] - dates[0]).dt.days.to_numpy()
+        known = (app_idx >= 0) & (product_idx >= 0)
+        scores[app_idx[known], product_idx[known], day_idx[known]] = last_week['anomaly_score'].to_numpy()[known]
+        # Max anomaly score per app × product over last week
+        if summary is None:
+            pivot = last_week.groupby(['application_name', 'product_name'])['anomaly_score'].max().unstack(fill_value=0)
+        else:
+            pivot = summary.pivot(index='application_name', columns='product_name', values='max_score').fillna(0)
+        pivot = pivot.reindex(index=applications, columns=products, fill_value=0)
+    return pivot, scores, dates
+
+
+def save_heatmap_data(anomalies_df, path, applications=APPLICATIONS, products=AWS_PRODUCTS):
+    """Write heatmap_last_week's arrays to a .npz file for dashboards that do their own drawing."""
+    pivot, scores, dates = heatmap_last_week(anomalies_df, applications, products)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(
+        path,
+        applications=np.array(applications, dtype=str),
+        products=np.array(products, dtype=str),
+        dates=dates.to_numpy(dtype="datetime64[D]"),
+        max_scores=pivot.to_numpy(dtype=float),
+        scores=scores,
+    )
+    return path
+
+
+def _heatmap_title(last_date):
+    return f"AWS Products Anomaly Strength (Last 7 Days) — up to {last_date.date()}"
+
+
+def plot_heatmap_last_week(anomalies_df, output=None, applications=APPLICATIONS, products=AWS_PRODUCTS):
+    """Show the last week's heatmap, or with `output` (.png / .svg) write it headless."""
     if anomalies_df.empty:
         print("No anomalies to display.")
         return
 
-    last_date = anomalies_df['date'].max()
-    start_date = last_date - pd.Timedelta(days=6)
-    last_week = anomalies_df[anomalies_df['date'].between(start_date, last_date)]
-
-    # Max anomaly score per app × product over last week
-    pivot = last_week.groupby(['application_name', 'product_name'])['anomaly_score'].max().unstack(fill_value=0)
-    pivot = pivot.reindex(index=APPLICATIONS, columns=AWS_PRODUCTS, fill_value=0)
-
-    plt.figure(figsize=(16, 10))
-    sns.heatmap(
-        pivot,
-        annot=True,
-        cmap="Spectral",  # richer distribution of colors
-        center=0,
-        fmt=".2f",
-        linewidths=0.5,
-        linecolor="gray",
-        cbar_kws={'label': 'Anomaly Strength'}
-    )
-    plt.title(f"AWS Products Anomaly Strength (Last 7 Days) — up to {last_date.date()}", fontsize=16)
-    plt.ylabel("Application", fontsize=12)
-    plt.xlabel("AWS Product", fontsize=12)
-    plt.yticks(rotation=0)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    pivot, _, dates = heatmap_last_week(anomalies_df, applications, products)
+    with stage_profiler.stage("plotting"):
+        if output is not None:
+            name, extension = os.path.splitext(os.path.basename(output))
+            return report_rendering.render_heatmaps(
+                [(name, pivot, _heatmap_title(dates[-1]))], os.path.dirname(output) or ".", extension.lstrip("."),
+                **HEATMAP_STYLE
+            )[0]
+        plt = report_rendering.pyplot()
+        report_rendering.draw_heatmap(plt.figure(figsize=(16, 10)), pivot, _heatmap_title(dates[-1]), **HEATMAP_STYLE)
     plt.show()
 
+
+def render_heatmap_reports(anomalies_df, groups: dict, out_dir, weeks=1, file_format="png", n_jobs=None):
+    """
+    Headless batch: one heatmap file per group (name -> its applications, e.g. a
+    team) and per week, the latest `weeks` weeks, rendered on n_jobs worker
+    processes. Returns the written paths.
+    """
+    if anomalies_df.empty:
+        return []
+    last_date = _last_scored_date(anomalies_df)
+    jobs = []
+    for week in range(weeks):
+        week_end = last_date - pd.Timedelta(days=HEATMAP_DAYS * week)
+        for group, applications in groups.items():
+            pivot, _, _ = heatmap_last_week(anomalies_df, applications, last_date=week_end)
+            jobs.append((f"{group}_{week_end.date()}", pivot, f"{group}: {_heatmap_title(week_end)}"))
+    with stage_profiler.stage("plotting"):
+        return report_rendering.render_heatmaps(jobs, out_dir, file_format, n_jobs, **HEATMAP_STYLE)
+
+# ---------- On-demand Service ----------
+# asyncio and the service module are only imported by the service itself.
+async def _serve_forever(host, port, **service_kwargs):
+    from anomaly_service import AnomalyService, serve
+    async with AnomalyService(fit_with_states, refit_every=REFIT_EVERY_DAYS, drift_threshold=DRIFT_THRESHOLD,
+                              **service_kwargs) as service:
+        server = await serve(service, host, port)
+        print("Serving anomaly checks on", ", ".join(str(sock.getsockname()) for sock in server.sockets))
+        async with server:
+            await server.serve_forever()
+
+
+def run_service(host="127.0.0.1", port=8765, n_workers=None, **service_kwargs):
+    """Serve single-series anomaly checks over TCP until interrupted (see anomaly_service.py)."""
+    import asyncio
+    asyncio.run(_serve_forever(host, port, n_workers=n_workers, **service_kwargs))
+
 # ---------- Main ----------
-if __name__ == "__main__":
-    generator = DummyDataGenerator(APPLICATIONS, AWS_PRODUCTS, days=120)
-    df = generator.generate()
+def parse_args(argv=None):
+    parser = cli.base_parser("Holt-Winters anomaly scores per application × product, with a heatmap of the last week.")
+    parser.add_argument("--engine", choices=ENGINES, default="statsmodels")
+    parser.add_argument("--n-jobs", type=int, default=1, help="statsmodels engine: worker processes (-1: all cores)")
+    parser.add_argument("--threshold", choices=THRESHOLD_STRATEGIES, default="std")
+    parser.add_argument("--gap-policy", choices=GAP_POLICIES, default="zero")
+    parser.add_argument("--store", help=f"anomaly score store (SQLite) to append to (default: {ANOMALY_STORE_PATH}, "
+                                        "with --input output/anomaly_scores_<input name>.sqlite)")
+    parser.add_argument("--no-plots", action="store_true", help="skip the heatmap")
+    service = parser.add_argument_group("on-demand service")
+    service.add_argument("--serve", action="store_true", help="serve single-series checks instead of a batch run")
+    service.add_argument("--host", default="127.0.0.1")
+    service.add_argument("--port", type=int, default=8765)
+    service.add_argument("--workers", type=int, help="fit processes (default: all cores)")
+    return cli.parse(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        run_service(args.host, args.port, args.workers)
+        return
 
-    anomalies_df = detect_anomalies_holtwinters(df)
-    plot_heatmap_last_week(anomalies_df)
+    with stage_profiler.stage("generate"):
+        if args.input:
+            df = read_cost_rows(args.input)
+            applications, products = list(df.applications), list(df.products)
+        else:
+            df = DummyDataGenerator(APPLICATIONS, AWS_PRODUCTS, days=120).generate()
+            applications, products = APPLICATIONS, AWS_PRODUCTS
+
+    anomalies_df = detect_anomalies_holtwinters(df, n_jobs=args.n_jobs, engine=args.engine,
+                                                threshold=args.threshold, gap_policy=args.gap_policy)
+    with stage_profiler.stage("store_append"):
+        store = AnomalyScoreStore(args.store or default_store_path(args.input))
+        store.append(anomalies_df)
+    out_dir = args.report_dir  # --report-dir / COST_REPORT_DIR: write files, no window
+    if args.no_plots:
+        pass
+    elif out_dir is None:
+        plot_heatmap_last_week(store, applications=applications, products=products)
+    elif store.empty:
+        print("No anomalies to display.")
+    else:
+        print("Saved", plot_heatmap_last_week(store, os.path.join(out_dir, "anomaly_heatmap_last_week.png"),
+                                                 applications, products))
+        print("Saved", save_heatmap_data(store, os.path.join(out_dir, "anomaly_heatmap_last_week.npz"),
+                                         applications, products))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from holtwinters_state import DRIFT_THRESHOLD, KEY_COLUMNS, REFIT_EVERY_DAYS, update_states
+
+# ---------- On-demand anomaly service ----------
+# Scores single application × product series for callers such as the
+# cost-monitoring service. Requests that arrive within max_delay of each other
+# are batched (up to max_batch series) into one fit call, which runs on a
+# process pool so the event loop keeps accepting requests while it fits.
+#
+# The fitted Holt-Winters state of the most recently checked series is kept in
+# an LRU cache together with the history it covers and that history's scores.
+# When a series comes back with the same history plus new days, the new days are
+# scored by continuing the saved recursions (update_states, vectorized over the
+# batch) instead of refitting. A series is refitted when it is not cached, when
+# its history changed, when its fit is refit_every days old or when its
+# residual drift passes drift_threshold, like detect_anomalies_incremental.
+#
+# Wire format (serve / AnomalyClient): one JSON object per line, request
+# {"application_name", "product_name", "dates": [...], "costs": [...]},
+# response {"dates": [...], "scores": [...]} or {"error": "..."}.
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_DELAY = 0.01  # seconds a request waits for others to join its batch
+DEFAULT_CACHE_SIZE = 1024  # series whose fitted state is kept
+
+
+def _daily(dates, costs) -> pd.Series:
+    series = pd.Series(np.asarray(costs, dtype=float), index=pd.to_datetime(dates))
+    return series.groupby(level=0).sum().asfreq("D").fillna(0.0)
+
+
+def _digest(series: pd.Series) -> str:
+    digest = hashlib.sha256(str(series.index[0] if len(series) else "").encode())
+    digest.update(series.to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class _Request:
+    def __init__(self, key, series, future):
+        self.key = key
+        self.series = series
+        self.future = future
+
+
+class AnomalyService:
+    """
+    `fit` takes a long cost frame (application_name, product_name, date,
+    eur_total_costs) and returns (anomalies, states) like fit_with_states in
+    1.8million_worth_of_code.py; it must be picklable for the process pool.
+    """
+
+    def __init__(self, fit, n_workers=None, executor=None, max_batch=DEFAULT_MAX_BATCH,
+                 max_delay=DEFAULT_MAX_DELAY, cache_size=DEFAULT_CACHE_SIZE,
+                 refit_every=REFIT_EVERY_DAYS, drift_threshold=DRIFT_THRESHOLD):
+        self.fit = fit
+        self._own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=n_workers)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.cache_size = cache_size
+        self.refit_every = pd.Timedelta(days=refit_every)
+        self.drift_threshold = drift_threshold
+        self.cache = OrderedDict()  # (app, product) -> {"state", "digest", "scores"}
+        self.stats = {"requests": 0, "batches": 0, "refits": 0, "warm": 0, "hits": 0}
+        self._queue = None
+        self._batcher = None
+        self._in_flight = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._collect())
+        return self
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            await asyncio.gather(self._batcher, return_exceptions=True)
+            self._batcher = None
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._own_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def score(self, app, product, dates, costs) -> pd.DataFrame:
+        """Anomaly scores (date, anomaly_score) of one series; empty when it is too short to fit."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Request((app, product), _daily(dates, costs), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            # several batches may be fitting at once, one per pool worker
+            task = asyncio.create_task(self._score_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _score_batch(self, batch):
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        # a fit frame holds one history per series, so repeated keys go to a later round
+        rounds = []
+        for request in batch:
+            for requests in rounds:
+                if request.key not in requests:
+                    requests[request.key] = request
+                    break
+            else:
+                rounds.append({request.key: request})
+        for requests in rounds:
+            try:
+                results = await self._score_round(list(requests.values()))
+            except Exception as e:
+                for request in requests.values():
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            for request in requests.values():
+                if not request.future.done():
+                    request.future.set_result(results[request.key])
+
+    def _cached(self, request):
+        """The cache entry `request` can continue from, plus the days it adds; (None, None) to refit."""
+        entry = self.cache.get(request.key)
+        if entry is None:
+            return None, None
+        series, last_date = request.series, entry["state"]["last_date"]
+        if len(series) == 0 or series.index[-1] < last_date:
+            return None, None
+        if series.index[-1] - entry["state"]["fitted_on"] >= self.refit_every:
+            return None, None
+        if _digest(series[series.index <= last_date]) != entry["digest"]:
+            return None, None
+        return entry, series[series.index > last_date]
+
+    def _remember(self, key, state, series, scores):
+        self.cache[key] = {"state": state, "digest": _digest(series), "scores": scores}
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _score_round(self, requests) -> dict:
+        results, warm, refit = {}, [], []
+        for request in requests:
+            entry, new_days = self._cached(request)
+            if entry is None:
+                refit.append(request)
+            elif new_days.empty:
+                self.stats["hits"] += 1
+                self.cache.move_to_end(request.key)
+                results[request.key] = entry["scores"]
+            else:
+                warm.append((request, entry, new_days))
+
+        if warm:
+            # one (series × new days) array for every warm series of the round, NaN-padded
+            states = pd.DataFrame([entry["state"] for _, entry, _ in warm])
+            values = np.full((len(warm), max(len(days) for *_, days in warm)), np.nan)
+            for i, (*_, days) in enumerate(warm):
+                values[i, :len(days)] = days.to_numpy()
+            states, scores = update_states(states, values)
+            for i, (request, entry, days) in enumerate(warm):
+                state = states.iloc[i].copy()
+                if abs(state["drift"]) > self.drift_threshold:
+                    refit.append(request)
+                    continue
+                self.stats["warm"] += 1
+                state["last_date"] = days.index[-1]
+                new_scores = pd.DataFrame({"date": days.index, "anomaly_score": scores[i, :len(days)]})
+                results[request.key] = pd.concat([entry["scores"], new_scores], ignore_index=True)
+                self._remember(request.key, state, request.series, results[request.key])
+
+        if refit:
+            self.stats["refits"] += len(refit)
+            frame = pd.concat([
+                pd.DataFrame({"application_name": request.key[0], "product_name": request.key[1],
+                              "date": request.series.index, "eur_total_costs": request.series.to_numpy()})
+                for request in refit
+            ], ignore_index=True)
+            loop = asyncio.get_running_loop()
+            anomalies, states = await loop.run_in_executor(self.executor, self.fit, frame)
+            by_key = dict(iter(anomalies.groupby(KEY_COLUMNS, sort=False))) if len(anomalies) else {}
+            for request in refit:
+                scores = by_key.get(request.key)
+                if scores is None:  # too short to fit
+                    results[request.key] = pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"),
+                                                         "anomaly_score": pd.Series(dtype=float)})
+                    self.cache.pop(request.key, None)
+                    continue
+                results[request.key] = scores[["date", "anomaly_score"]].reset_index(drop=True)
+                self._remember(request.key, states.loc[request.key].copy(), request.series, results[request.key])
+        return results
+
+
+# ---------- Socket server and stand-in client ----------
+async def serve(service, host="127.0.0.1", port=0):
+    """Start a line-delimited JSON server for `service`; port 0 picks a free port (see server.sockets)."""
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    scores = await service.score(request["application_name"], request["product_name"],
+                                                 request["dates"], request["costs"])
+                    response = {"dates": scores["date"].dt.strftime("%Y-%m-%d").tolist(),
+                                "scores": scores["anomaly_score"].tolist()}
+                except Exception as e:
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except asyncio.CancelledError:
+            pass  # event loop shutting down while the client is still connected
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class AnomalyClient:
+    """One connection, one request at a time; open several clients for concurrency."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def __aenter__(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def score(self, app, product, dates, costs) -> dict:
+        request = {"application_name": app, "product_name": product,
+                   "dates": [str(pd.Timestamp(d).date()) for d in dates], "costs": [float(c) for c in costs]}
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        await self._writer.drain()
+        response = json.loads(await self._reader.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+
+async def run_load(host, port, requests, concurrency=16) -> dict:
+    """
+    Send (app, product, dates, costs) requests over `concurrency` connections and
+    report client-side latency percentiles (milliseconds) and throughput.
+    """
+    requests = list(requests)
+    latencies = []
+
+    async def worker(share):
+        async with AnomalyClient(host, port) as client:
+            for request in share:
+                start = time.perf_counter()
+                await client.score(*request)
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(requests[i::concurrency]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) else float("nan"),
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) else float("nan"),
+        "throughput_rps": len(latencies) / elapsed if elapsed else float("nan"),
+    }
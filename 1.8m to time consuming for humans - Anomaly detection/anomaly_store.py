@@ -0,0 +1,174 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# ---------- Persistent anomaly score store ----------
+# Every run appends its scores to one SQLite file. Scores are keyed by
+# (day, series) with days stored as integers since 1970-01-01, so a last-N-days
+# query is a range scan of the primary key and never touches older history.
+# The rolling_summary table keeps max / min score and the number of anomalous
+# days per series over the last ROLLING_DAYS days. An append refreshes it from
+# those days only, so reading it costs the same however long the history is.
+ROLLING_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    series_id INTEGER PRIMARY KEY,
+    application_name TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    UNIQUE (application_name, product_name)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    day INTEGER NOT NULL,
+    series_id INTEGER NOT NULL REFERENCES series (series_id),
+    anomaly_score REAL NOT NULL,
+    PRIMARY KEY (day, series_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_by_series ON scores (series_id, day);
+CREATE TABLE IF NOT EXISTS rolling_summary (
+    series_id INTEGER PRIMARY KEY REFERENCES series (series_id),
+    window_end INTEGER NOT NULL,
+    max_score REAL NOT NULL,
+    min_score REAL NOT NULL,
+    anomalous_days INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+def _to_days(dates) -> np.ndarray:
+    return pd.to_datetime(dates).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _to_dates(days) -> pd.Series:
+    return pd.Series(np.asarray(days, dtype=np.int64).astype("datetime64[D]").astype("datetime64[ns]"))
+
+
+class AnomalyScoreStore:
+    """Anomaly scores of all runs in a local SQLite file (see the notes above)."""
+
+    def __init__(self, path, rolling_days=ROLLING_DAYS):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.rolling_days = rolling_days
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+        saved = self.connection.execute("SELECT value FROM meta WHERE key = 'rolling_days'").fetchone()
+        if saved is None:
+            with self.connection:
+                self.connection.execute("INSERT INTO meta VALUES ('rolling_days', ?)", (rolling_days,))
+        elif saved[0] != rolling_days:
+            raise ValueError(f"{path} keeps a {saved[0]}-day rolling summary, not {rolling_days} days")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _last_day(self):
+        return self.connection.execute("SELECT MAX(day) FROM scores").fetchone()[0]
+
+    def last_date(self):
+        day = self._last_day()
+        return None if day is None else _to_dates([day]).iat[0]
+
+    @property
+    def empty(self) -> bool:
+        return self._last_day() is None
+
+    def _series_ids(self, keys: pd.DataFrame) -> np.ndarray:
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO series (application_name, product_name) VALUES (?, ?)",
+            keys.itertuples(index=False, name=None),
+        )
+        known = pd.read_sql_query("SELECT series_id, application_name, product_name FROM series", self.connection)
+        lookup = pd.MultiIndex.from_frame(known[["application_name", "product_name"]])
+        return known["series_id"].to_numpy()[lookup.get_indexer(pd.MultiIndex.from_frame(keys))]
+
+    def append(self, anomalies_df: pd.DataFrame) -> int:
+        """
+        Add the scores of a run (layout of detect_anomalies_holtwinters). A day
+        that is already stored for a series is overwritten, so reruns are safe.
+        """
+        if anomalies_df.empty:
+            return 0
+        keys = anomalies_df[["application_name", "product_name"]].astype(str)
+        days = _to_days(anomalies_df["date"])
+        with self.connection:
+            previous_end = self._last_day()
+            unique = keys.drop_duplicates()
+            series_ids = self._series_ids(unique)
+            ids = pd.Series(series_ids, index=pd.MultiIndex.from_frame(unique)).reindex(
+                pd.MultiIndex.from_frame(keys)).to_numpy()
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores (day, series_id, anomaly_score) VALUES (?, ?, ?)",
+                zip(days.tolist(), ids.tolist(), anomalies_df["anomaly_score"].astype(float).tolist()),
+            )
+            end = self._last_day()
+            # a new last day moves every series' window; otherwise only the touched series change
+            touched = None if previous_end is None or end > previous_end else np.unique(series_ids)
+            self._refresh_summary(end, touched)
+        return len(anomalies_df)
+
+    def _refresh_summary(self, end, series_ids=None):
+        where, params = "", {"start": end - self.rolling_days, "end": end}
+        if series_ids is not None:
+            where = f" AND series_id IN ({','.join(str(int(i)) for i in series_ids)})"
+            self.connection.execute(f"DELETE FROM rolling_summary WHERE 1 = 1{where}")
+        else:
+            self.connection.execute("DELETE FROM rolling_summary")
+        self.connection.execute(
+            "INSERT INTO rolling_summary (series_id, window_end, max_score, min_score, anomalous_days) "
+            "SELECT series_id, :end, MAX(anomaly_score), MIN(anomaly_score), SUM(anomaly_score != 0) "
+            f"FROM scores WHERE day > :start AND day <= :end{where} GROUP BY series_id",
+            params,
+        )
+
+    def window(self, days, end=None) -> pd.DataFrame:
+        """Scores of the `days` days up to `end` (default: the last stored day), long format."""
+        end_day = self._last_day() if end is None else int(_to_days([end])[0])
+        if end_day is None:
+            return pd.DataFrame(columns=["application_name", "product_name", "date", "anomaly_score"])
+        rows = pd.read_sql_query(
+            "SELECT s.application_name, s.product_name, w.day, w.anomaly_score "
+            "FROM scores AS w JOIN series AS s USING (series_id) "
+            "WHERE w.day > ? AND w.day <= ? ORDER BY s.application_name, s.product_name, w.day",
+            self.connection, params=(end_day - days, end_day),
+        )
+        rows.insert(2, "date", _to_dates(rows.pop("day")))
+        return rows
+
+    def max_scores(self, days, end=None) -> pd.DataFrame:
+        """Max score per application × product over the `days` days up to `end`, computed in SQL."""
+        end_day = self._last_day() if end is None else int(_to_days([end])[0])
+        return pd.read_sql_query(
+            "SELECT s.application_name, s.product_name, MAX(w.anomaly_score) AS max_score "
+            "FROM scores AS w JOIN series AS s USING (series_id) "
+            "WHERE w.day > ? AND w.day <= ? GROUP BY w.series_id "
+            "ORDER BY s.application_name, s.product_name",
+            self.connection, params=(end_day - days, end_day) if end_day is not None else (0, -1),
+        )
+
+    def rolling_summary(self, min_abs_score=None) -> pd.DataFrame:
+        """
+        The precomputed last-ROLLING_DAYS summary per series; with min_abs_score only
+        the series with a score at least that far from 0 (alert candidates).
+        """
+        where = "" if min_abs_score is None else " WHERE MAX(r.max_score, -r.min_score) >= :limit"
+        summary = pd.read_sql_query(
+            "SELECT s.application_name, s.product_name, r.window_end, r.max_score, r.min_score, r.anomalous_days "
+            f"FROM rolling_summary AS r JOIN series AS s USING (series_id){where} "
+            "ORDER BY s.application_name, s.product_name",
+            self.connection, params={"limit": min_abs_score},
+        )
+        summary["window_end"] = _to_dates(summary["window_end"])
+        return summary
@@ -0,0 +1,109 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# ---------- Streaming cost-export ingestion ----------
+# Cost exports can be several GB, so they are read in chunks and handed on one
+# application × product series at a time. Two ways to find where a series ends:
+#
+# - presorted=True: the export is sorted by (application_name, product_name), a
+#   series is complete as soon as the key changes (sort-and-scan). Only the
+#   current series is buffered.
+# - presorted=False: rows are hash-partitioned by key into spill files on local
+#   disk, then every partition is loaded and split into its series. Peak memory
+#   is one chunk plus one partition, so raise n_buckets for bigger exports.
+COST_COLUMNS = ["application_name", "product_name", "date", "eur_total_costs"]
+KEY_COLUMNS = ["application_name", "product_name"]
+DEFAULT_CHUNKSIZE = 1_000_000  # rows per read
+DEFAULT_BUCKETS = 256
+
+
+def _parquet_files(path):
+    """A .parquet file, or the .parquet parts of a directory in name order (as write_parquet_parts numbers them)."""
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".parquet")]
+    return [path]
+
+
+def iter_cost_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield DataFrames of at most `chunksize` rows from a CSV or Parquet cost
+    export; a directory is read as Parquet parts, one part after the other.
+    """
+    if str(path).endswith(".parquet") or os.path.isdir(path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet cost exports requires pyarrow (pip install pyarrow)") from e
+        for part in _parquet_files(path):
+            for batch in pq.ParquetFile(part).iter_batches(batch_size=chunksize, columns=COST_COLUMNS):
+                yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=COST_COLUMNS, chunksize=chunksize)
+
+
+def _scan_sorted(chunks):
+    pending = None  # rows of the series that may continue in the next chunk
+    completed = set()
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        apps = chunk["application_name"].to_numpy()
+        products = chunk["product_name"].to_numpy()
+        bounds = [0, *(np.flatnonzero((apps[1:] != apps[:-1]) | (products[1:] != products[:-1])) + 1), len(chunk)]
+        for start, end in zip(bounds[:-2], bounds[1:-1]):
+            key = (apps[start], products[start])
+            if key in completed:
+                raise ValueError(f"Cost export is not sorted by {KEY_COLUMNS}: {key} appears twice")
+            completed.add(key)
+            yield key, chunk.iloc[start:end].reset_index(drop=True)
+        pending = chunk.iloc[bounds[-2]:]
+    if pending is not None and len(pending):
+        key = (pending["application_name"].iat[0], pending["product_name"].iat[0])
+        if key in completed:
+            raise ValueError(f"Cost export is not sorted by {KEY_COLUMNS}: {key} appears twice")
+        yield key, pending.reset_index(drop=True)
+
+
+def _scan_partitioned(chunks, n_buckets, tmp_dir):
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as spill_dir:
+        spill_files = {}
+        try:
+            for chunk in chunks:
+                buckets = pd.util.hash_pandas_object(chunk[KEY_COLUMNS], index=False).to_numpy() % n_buckets
+                for bucket, part in chunk.groupby(buckets):
+                    if bucket not in spill_files:
+                        spill_files[bucket] = open(os.path.join(spill_dir, f"bucket_{bucket}.pkl"), "wb")
+                    pickle.dump(part, spill_files[bucket], protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in spill_files.values():
+                f.close()
+
+        for bucket in sorted(spill_files):
+            path = os.path.join(spill_dir, f"bucket_{bucket}.pkl")
+            parts = []
+            with open(path, "rb") as f:
+                while True:
+                    try:
+                        parts.append(pickle.load(f))
+                    except EOFError:
+                        break
+            os.remove(path)
+            for key, series in pd.concat(parts, ignore_index=True).groupby(KEY_COLUMNS, sort=True):
+                yield key, series.reset_index(drop=True)
+
+
+def iter_series_frames(path, presorted=False, chunksize=DEFAULT_CHUNKSIZE, n_buckets=DEFAULT_BUCKETS, tmp_dir=None):
+    """
+    Yield ((application_name, product_name), rows) for every series of a cost export.
+
+    Each series is yielded once, complete, as soon as all its rows have been
+    read; see the notes above for the two modes.
+    """
+    chunks = iter_cost_chunks(path, chunksize)
+    if presorted:
+        return _scan_sorted(chunks)
+    return _scan_partitioned(chunks, n_buckets, tmp_dir)
@@ -0,0 +1,116 @@
+import numpy as np
+
+# ---------- Batched Holt-Winters engine ----------
+# Additive trend + additive weekly seasonality, fitted for many equal-length
+# series at once. Every recursion step and every candidate parameter set is an
+# array operation over (series × candidates), so the per-series Python and
+# optimizer overhead of statsmodels disappears. Initial states come from a
+# regression and the smoothing parameters from a coarse grid followed by a few
+# local refinement rounds, so results are close to, not identical with,
+# statsmodels' "estimated" fit (see check_batch_equivalence).
+SEASONAL_PERIODS = 7
+ALPHA_GRID = np.array([0.05, 0.2, 0.45, 0.7, 0.95])
+BETA_GRID = np.array([0.0, 0.02, 0.1])
+GAMMA_GRID = np.array([0.0, 0.1, 0.3])
+REFINE_STEPS = [(0.1, 0.02, 0.1), (0.05, 0.01, 0.05), (0.02, 0.005, 0.02)]
+BLOCK_SIZE = 2048  # series per block, bounds the (series × candidates × days) work set
+
+
+def initial_states(y: np.ndarray, m=SEASONAL_PERIODS):
+    """
+    Initial level, slope and seasonal offsets from one least-squares regression
+    of every series on a linear trend plus day-of-week dummies.
+
+    statsmodels' "estimated" initialization optimizes these jointly with the
+    smoothing parameters; the regression lands close to that optimum and costs a
+    single matrix product for the whole block.
+    """
+    t = np.arange(y.shape[1])
+    design = np.column_stack([np.ones(len(t)), t] + [(t % m == k) for k in range(m)]).astype(float)
+    coef = y @ np.linalg.pinv(design).T
+    # the dummies are collinear with the intercept: move their mean into the level
+    shift = coef[:, 2:].mean(axis=1)
+    season = coef[:, 2:] - shift[:, None]
+    trend = coef[:, 1]
+    level = coef[:, 0] + shift - trend  # state *before* day 0, as in statsmodels
+    return level, trend, season
+
+
+def _constrain(alpha, beta, gamma):
+    # Same admissible region statsmodels uses: 0 <= beta <= alpha, 0 <= gamma <= 1 - alpha
+    alpha = np.clip(alpha, 0.0, 1.0)
+    beta = np.clip(beta, 0.0, alpha)
+    gamma = np.clip(gamma, 0.0, 1.0 - alpha)
+    return alpha, beta, gamma
+
+
+def holt_winters_filter(y, alpha, beta, gamma, level, trend, season, keep_fitted=False):
+    """
+    Run the additive recursions for every series and candidate at once.
+
+    y is (series × days); alpha/beta/gamma/level/trend are (series × candidates)
+    and season is (series × candidates × period). Returns the sum of squared
+    one-step errors per (series, candidate) and, with keep_fitted, the one-step
+    fitted values (series × candidates × days).
+    """
+    m = season.shape[-1]
+    season = season.copy()
+    sse = np.zeros(alpha.shape)
+    fitted = np.empty(alpha.shape + (y.shape[1],)) if keep_fitted else None
+    for t in range(y.shape[1]):
+        obs = y[:, t, None]
+        s0 = season[..., t % m]
+        forecast = level + trend + s0
+        if keep_fitted:
+            fitted[..., t] = forecast
+        sse += (obs - forecast) ** 2
+        new_level = alpha * (obs - s0) + (1 - alpha) * (level + trend)
+        season[..., t % m] = gamma * (obs - level - trend) + (1 - gamma) * s0
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+    return sse, fitted
+
+
+def _search(y, level, trend, season):
+    grid = np.array(np.meshgrid(ALPHA_GRID, BETA_GRID, GAMMA_GRID, indexing="ij")).reshape(3, -1)
+    candidates = np.broadcast_to(grid[:, None, :], (3, len(y), grid.shape[1]))
+    best = None
+    for step in [None, *REFINE_STEPS]:
+        if step is not None:
+            offsets = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij")).reshape(3, -1)
+            candidates = best[:, :, None] + offsets[:, None, :] * np.array(step)[:, None, None]
+        alpha, beta, gamma = _constrain(*candidates)
+        n = alpha.shape[1]
+        sse, _ = holt_winters_filter(
+            y, alpha, beta, gamma,
+            np.repeat(level[:, None], n, axis=1),
+            np.repeat(trend[:, None], n, axis=1),
+            np.repeat(season[:, None, :], n, axis=1)
+        )
+        pick = np.nanargmin(sse, axis=1)
+        rows = np.arange(len(y))
+        best = np.stack([alpha[rows, pick], beta[rows, pick], gamma[rows, pick]])
+    return best
+
+
+def fit_batch(y: np.ndarray):
+    """
+    Fit every row of y (series × days) and return (fitted values, parameters).
+
+    Parameters come back as a (series × 3) array of alpha, beta, gamma.
+    """
+    y = np.asarray(y, dtype=float)
+    fitted = np.empty_like(y)
+    params = np.empty((len(y), 3))
+    for start in range(0, len(y), BLOCK_SIZE):
+        block = y[start:start + BLOCK_SIZE]
+        level, trend, season = initial_states(block)
+        alpha, beta, gamma = _search(block, level, trend, season)
+        _, block_fitted = holt_winters_filter(
+            block, alpha[:, None], beta[:, None], gamma[:, None],
+            level[:, None], trend[:, None], season[:, None, :], keep_fitted=True
+        )
+        fitted[start:start + BLOCK_SIZE] = block_fitted[:, 0, :]
+        params[start:start + BLOCK_SIZE] = np.column_stack([alpha, beta, gamma])
+    return fitted, params
+
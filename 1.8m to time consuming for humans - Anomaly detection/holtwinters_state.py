@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import atomic_pickle
+from holtwinters_batch import SEASONAL_PERIODS
+
+# ---------- Saved Holt-Winters state ----------
+# One row per application × product: the smoothing parameters of the last full
+# fit plus the level / trend / seasonal state after the last scored day. With
+# these the additive recursions can be continued over new days without a refit.
+# Next to it the store keeps the most recent cost rows of every series, so a
+# series can be refitted without the caller passing its full history again.
+KEY_COLUMNS = ["application_name", "product_name"]
+SEASON_COLUMNS = [f"season_{i}" for i in range(SEASONAL_PERIODS)]
+DATE_COLUMNS = ["last_date", "fitted_on"]
+STATE_COLUMNS = [
+    "last_date", "fitted_on", "level", "trend", *SEASON_COLUMNS,
+    "alpha", "beta", "gamma", "threshold", "drift"
+]
+HISTORY_COLUMNS = KEY_COLUMNS + ["date", "eur_total_costs"]
+# when a saved state is replaced by a full refit (incremental mode and the service)
+REFIT_EVERY_DAYS = 28  # at least every 4 weeks
+DRIFT_THRESHOLD = 0.5  # or when the residual EWMA passes this
+
+
+def state_from_model(app, product, model, series: pd.Series, threshold) -> dict:
+    """Snapshot a fitted statsmodels ExponentialSmoothing result as a state row."""
+    params = model.params
+    # season[-7:] is ordered so that season_0 belongs to the next (unseen) day
+    season = np.asarray(model.season, dtype=float)[-SEASONAL_PERIODS:]
+    state = {
+        "application_name": app,
+        "product_name": product,
+        "last_date": series.index[-1],
+        "fitted_on": series.index[-1],
+        "level": float(np.asarray(model.level)[-1]),
+        "trend": float(np.asarray(model.trend)[-1]),
+        "alpha": float(params["smoothing_level"]),
+        "beta": float(params["smoothing_trend"]),
+        "gamma": float(params["smoothing_seasonal"]),
+        "threshold": float(threshold),
+        "drift": 0.0,
+    }
+    state.update(zip(SEASON_COLUMNS, season))
+    return state
+
+
+def update_states(states: pd.DataFrame, values: np.ndarray, cutoff=0.8, drift_weight=0.2):
+    """
+    Continue the additive-trend / additive-seasonal recursions over new days.
+
+    `values` is a (series × new days) array aligned with the rows of `states`;
+    NaN marks days past the end of a series, which leave its state untouched.
+    Returns the updated states and the anomaly scores of the new days, scored
+    with the residual threshold saved at fit time.
+    """
+    level = states["level"].to_numpy(dtype=float)
+    trend = states["trend"].to_numpy(dtype=float)
+    season = states[SEASON_COLUMNS].to_numpy(dtype=float)
+    alpha = states["alpha"].to_numpy(dtype=float)
+    beta = states["beta"].to_numpy(dtype=float)
+    gamma = states["gamma"].to_numpy(dtype=float)
+    threshold = states["threshold"].to_numpy(dtype=float)
+    drift = states["drift"].to_numpy(dtype=float)
+
+    scores = np.full(values.shape, np.nan)
+    for t in range(values.shape[1]):
+        y = values[:, t]
+        observed = ~np.isnan(y)
+        s0 = season[:, 0]
+
+        score = (y - (level + trend + s0)) / threshold
+        scores[:, t] = np.where(np.abs(score) > cutoff, score, 0.0)
+        drift = np.where(observed, (1 - drift_weight) * drift + drift_weight * score, drift)
+
+        new_level = alpha * (y - s0) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - level - trend) + (1 - gamma) * s0
+
+        level = np.where(observed, new_level, level)
+        trend = np.where(observed, new_trend, trend)
+        rolled = np.column_stack([season[:, 1:], new_season])
+        season = np.where(observed[:, None], rolled, season)
+
+    scores[np.isnan(values)] = np.nan
+    updated = states.copy()
+    updated["level"] = level
+    updated["trend"] = trend
+    updated[SEASON_COLUMNS] = season
+    updated["drift"] = drift
+    return updated, scores
+
+
+class HoltWintersStateStore:
+    """
+    Pickled state table on local disk, keyed by (application_name, product_name),
+    and the kept cost rows in a second file next to it (`history_path`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.history_path = f"{path}.history"
+
+    def load(self) -> pd.DataFrame:
+        if not os.path.exists(self.path):
+            empty = pd.DataFrame(columns=KEY_COLUMNS + STATE_COLUMNS).astype(
+                {c: "datetime64[ns]" if c in DATE_COLUMNS else float for c in STATE_COLUMNS}
+            )
+            return empty.set_index(KEY_COLUMNS)
+        return pd.read_pickle(self.path)
+
+    def load_history(self) -> pd.DataFrame:
+        if not os.path.exists(self.history_path):
+            return pd.DataFrame(columns=HISTORY_COLUMNS).astype(
+                {"date": "datetime64[ns]", "eur_total_costs": float}
+            )
+        return pd.read_pickle(self.history_path)
+
+    def save(self, states: pd.DataFrame, history: pd.DataFrame = None):
+        if history is not None:  # first, so the states never refer to rows that were not kept
+            atomic_pickle.dump(history, self.history_path)
+        atomic_pickle.dump(states.sort_index(), self.path)
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# ---------- Residual threshold strategies ----------
+# Every strategy turns a series' residuals into a center and a scale, and the
+# anomaly score of a day is (resid - center) / scale; scores within the cutoff
+# are set to 0. Different anomaly methods can be used for different cases:
+#
+# --- Standard deviation rule (default) ---
+# Good when data is roughly normal. Raise sigma to reduce false positives.
+# center = 0, scale = sigma * std(resid)
+#
+# --- Median Absolute Deviation ---
+# Use when residuals contain large spikes (outliers). MAD is more stable
+# because a single big anomaly won't inflate it.
+# center = median(resid), scale = sigma * median(|resid - median|)
+#
+# --- Quantile thresholds ---
+# Use when data is skewed (not symmetric) or heavy-tailed. Consider when this is
+# used that even quartile outliers need to be detected! The scale is the
+# distance from the median to the (1 - quantile) or quantile residual, on the
+# side of the day, so with the default cutoff of 1 exactly the days outside the
+# (1 - quantile, quantile) range are flagged.
+THRESHOLD_STRATEGIES = ("std", "mad", "quantile")
+DEFAULT_SIGMA = 2.0
+DEFAULT_QUANTILE = 0.95
+DEFAULT_CUTOFFS = {"std": 0.8, "mad": 0.8, "quantile": 1.0}
+
+
+class ResidualMatrix:
+    """Residuals of many series stacked into one NaN-padded (series × days) matrix."""
+
+    def __init__(self, keys, dates: np.ndarray, values: np.ndarray):
+        self._index = keys if isinstance(keys, pd.MultiIndex) else None
+        self.keys = list(keys)  # (application_name, product_name) per row
+        self.dates = dates  # datetime64, NaT where a shorter series is padded
+        self.values = values
+
+    @property
+    def index(self) -> pd.MultiIndex:
+        """The keys as a MultiIndex: as given, or built on first use."""
+        if self._index is None:
+            self._index = pd.MultiIndex.from_tuples(self.keys) if self.keys else pd.MultiIndex.from_arrays([[], []])
+        return self._index
+
+    @classmethod
+    def stack(cls, rows):
+        """Build from (app, product, dates, residuals) rows of any length."""
+        rows = list(rows)
+        width = max((len(resid) for *_, resid in rows), default=0)
+        date_dtype = np.asarray(rows[0][2]).dtype if rows else "datetime64[ns]"
+        dates = np.full((len(rows), width), np.datetime64("NaT"), dtype=date_dtype)
+        values = np.full((len(rows), width), np.nan)
+        for i, (_, _, row_dates, resid) in enumerate(rows):
+            dates[i, :len(resid)] = row_dates
+            values[i, :len(resid)] = resid
+        return cls([(app, product) for app, product, *_ in rows], dates, values)
+
+    def to_frame(self, scores: np.ndarray, compact=False) -> pd.DataFrame:
+        """
+        Long application × product × date frame of `scores`, padding dropped. With
+        `compact` the name columns are categoricals (one code per row) instead of
+        a string per row.
+        """
+        if not self.keys:
+            return pd.DataFrame()
+        present = ~np.isnat(self.dates)
+        rows, _ = np.nonzero(present)
+        if compact:
+            apps, products = (pd.Categorical(part) for part in zip(*self.keys))
+        else:
+            apps, products = (np.array(part, dtype=object) for part in zip(*self.keys))
+        return pd.DataFrame({
+            'application_name': apps[rows],
+            'product_name': products[rows],
+            'date': self.dates[present],
+            'anomaly_score': scores[present]
+        })
+
+
+def _resolve_spec(spec, threshold, sigma, quantile, cutoff):
+    """(strategy, sigma, quantile, cutoff) of one override value (or of the default threshold)."""
+    if isinstance(spec, str):
+        spec = {"strategy": spec}
+    strategy = spec.get("strategy", threshold)
+    if strategy not in THRESHOLD_STRATEGIES:
+        raise ValueError(f"Unknown threshold strategy {strategy!r}, expected one of {THRESHOLD_STRATEGIES}")
+    row_cutoff = spec.get("cutoff", cutoff)
+    return (strategy, spec.get("sigma", sigma), spec.get("quantile", quantile),
+            DEFAULT_CUTOFFS[strategy] if row_cutoff is None else row_cutoff)
+
+
+def _row_settings(keys: pd.MultiIndex, threshold, overrides, sigma, quantile, cutoff):
+    """
+    Per-row strategy, sigma, quantile and cutoff after applying the overrides.
+    Rows are matched to overrides with index lookups; only the overrides are
+    looped over. A (app, product) override wins over a product override.
+    """
+    specs = [threshold]
+    row_spec = np.zeros(len(keys), dtype=np.intp)  # position in specs per row
+    if overrides and len(keys):
+        by_product = {key: spec for key, spec in overrides.items() if not isinstance(key, tuple)}
+        by_series = {key: spec for key, spec in overrides.items() if isinstance(key, tuple)}
+
+        def apply(index, row_keys, chosen):
+            codes = index.get_indexer(row_keys)
+            row_spec[codes >= 0] = len(specs) + codes[codes >= 0]
+            specs.extend(chosen.values())
+
+        if by_product:
+            apply(pd.Index(list(by_product)), keys.get_level_values(1), by_product)
+        if by_series:  # after the products, so series overrides win
+            apply(pd.MultiIndex.from_tuples(list(by_series)), keys, by_series)
+
+    resolved = [_resolve_spec(spec, threshold, sigma, quantile, cutoff) for spec in specs]
+    strategies, sigmas, quantiles, cutoffs = (np.array(column)[row_spec] for column in zip(*resolved))
+    return strategies, sigmas.astype(float), quantiles.astype(float), cutoffs.astype(float)
+
+
+def threshold_scores(values: np.ndarray, strategies, sigmas, quantiles, cutoffs) -> np.ndarray:
+    """Anomaly scores of a residual matrix, one vectorized pass per strategy."""
+    center = np.zeros(len(values))
+    lower = np.ones(len(values))
+    upper = np.ones(len(values))
+
+    rows = strategies == "std"
+    if rows.any():
+        upper[rows] = lower[rows] = sigmas[rows] * np.nanstd(values[rows], axis=1, ddof=1)
+
+    rows = strategies == "mad"
+    if rows.any():
+        center[rows] = np.nanmedian(values[rows], axis=1)
+        mad = np.nanmedian(np.abs(values[rows] - center[rows, None]), axis=1)
+        upper[rows] = lower[rows] = sigmas[rows] * mad
+
+    for q in np.unique(quantiles[strategies == "quantile"]):
+        rows = (strategies == "quantile") & (quantiles == q)
+        low, median, high = np.nanquantile(values[rows], [1 - q, 0.5, q], axis=1)
+        center[rows], lower[rows], upper[rows] = median, median - low, high - median
+
+    deviation = values - center[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = deviation / np.where(deviation < 0, lower[:, None], upper[:, None])
+    return np.where(np.abs(scores) > cutoffs[:, None], scores, 0.0)
+
+
+def score_residuals(residuals: ResidualMatrix, threshold="std", overrides=None, sigma=DEFAULT_SIGMA,
+                    quantile=DEFAULT_QUANTILE, cutoff=None, compact=False) -> pd.DataFrame:
+    """
+    Score a ResidualMatrix with the chosen threshold strategy.
+
+    `threshold` applies to every series unless `overrides` maps the series
+    ((app, product) tuple) or its product (str) to another strategy name, or to a
+    dict such as {"strategy": "quantile", "quantile": 0.99}. A cutoff of None
+    uses the strategy's default from DEFAULT_CUTOFFS. No refit is involved, so
+    the same residuals can be rescored with any strategy. `compact` is passed on
+    to ResidualMatrix.to_frame.
+    """
+    settings = _row_settings(residuals.index, threshold, overrides, sigma, quantile, cutoff)
+    return residuals.to_frame(threshold_scores(residuals.values, *settings), compact)
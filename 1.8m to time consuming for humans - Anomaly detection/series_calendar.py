@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from cost_frame import CostFrame
+from residual_thresholds import ResidualMatrix
+
+# ---------- Shared daily calendar ----------
+# All application × product series are laid out on one calendar of consecutive
+# days as a dense (series × days) array, built with one bincount over the
+# CostFrame codes instead of a groupby / set_index / asfreq per series. Rows
+# are ordered like groupby(['application_name', 'product_name']). A series
+# spans its first to its last row; cells outside the span are NaN. A day
+# inside the span without a cost (no row, or a NaN cost) is a gap, filled per
+# gap policy:
+#
+# zero        -- 0.0, what asfreq('D').fillna(0.0) did (default)
+# ffill       -- the last observed cost
+# interpolate -- linear between the observed costs around the gap
+# mask        -- interpolated for the fit, but the gap days get no residual
+#                and no score, so they do not move the thresholds either
+GAP_POLICIES = ("zero", "ffill", "interpolate", "mask")
+ONE_DAY = np.timedelta64(1, "D")
+
+
+def _fill_gaps(values, observed, gaps, policy):
+    if policy == "zero":
+        values[gaps] = 0.0
+        return values
+    n_days = values.shape[1]
+    positions = np.arange(n_days)
+    previous = np.maximum.accumulate(np.where(observed, positions, -1), axis=1)
+    following = np.minimum.accumulate(np.where(observed, positions, n_days)[:, ::-1], axis=1)[:, ::-1]
+    rows, days = np.nonzero(gaps)
+    before, after = previous[rows, days], following[rows, days]
+    # gaps at the edge of a span have an observed day on one side only
+    before, after = np.where(before < 0, after, before), np.where(after >= n_days, before, after)
+    known = (before >= 0) & (before < n_days)
+    before, after = np.where(known, before, 0), np.where(known, after, 0)
+    if policy == "ffill":
+        filled = values[rows, before]
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(after > before, (days - before) / (after - before), 0.0)
+        filled = values[rows, before] + weight * (values[rows, after] - values[rows, before])
+    values[rows, days] = np.where(known, filled, 0.0)
+    return values
+
+
+class SeriesCalendar:
+    def __init__(self, app_codes, product_codes, applications, products, dates, values, observed, gap_policy):
+        self.app_codes = np.asarray(app_codes)
+        self.product_codes = np.asarray(product_codes)
+        self.applications = pd.Index(applications)
+        self.products = pd.Index(products)
+        self.dates = np.asarray(dates)  # one per calendar day
+        self.values = values  # (series × days), gaps filled, NaN outside each span
+        self.observed = observed  # (series × days), True where the cost was given
+        self.gap_policy = gap_policy
+        in_span = ~np.isnan(values)
+        self.first = in_span.argmax(axis=1)
+        self.last = values.shape[1] - 1 - in_span[:, ::-1].argmax(axis=1)
+
+    @classmethod
+    def from_frame(cls, df, gap_policy="zero"):
+        """Align a long cost DataFrame or CostFrame; duplicate (series, day) rows are summed."""
+        if gap_policy not in GAP_POLICIES:
+            raise ValueError(f"Unknown gap policy {gap_policy!r}, expected one of {GAP_POLICIES}")
+        frame = df if isinstance(df, CostFrame) else CostFrame.from_pandas(df)
+        n_products = len(frame.products)
+        keys, rows = np.unique(frame.app_codes.astype(np.int64) * n_products + frame.product_codes,
+                               return_inverse=True)
+        start = frame.dates.min() if len(frame) else np.datetime64("1970-01-01", "ns")
+        days = ((frame.dates - start) // ONE_DAY).astype(np.int64)
+        n_days = int(days.max()) + 1 if len(frame) else 0
+        cells = rows * n_days + days
+        size = len(keys) * n_days
+        costs = frame.costs.astype(float)
+        given = ~np.isnan(costs)
+        sums = np.bincount(cells, weights=np.where(given, costs, 0.0), minlength=size).reshape(len(keys), n_days)
+        observed = np.bincount(cells[given], minlength=size).reshape(len(keys), n_days) > 0
+        present = np.bincount(cells, minlength=size).reshape(len(keys), n_days) > 0
+
+        # span: first to last row of the series, a gap is a day inside it without a cost
+        positions = np.arange(n_days)
+        first = present.argmax(axis=1)
+        last = n_days - 1 - present[:, ::-1].argmax(axis=1)
+        in_span = (positions >= first[:, None]) & (positions <= last[:, None])
+        values = _fill_gaps(np.where(observed, sums, np.nan), observed, in_span & ~observed, gap_policy)
+        return cls(keys // n_products, keys % n_products, frame.applications, frame.products,
+                   start + positions * ONE_DAY, values, observed, gap_policy)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.last - self.first + 1
+
+    def key(self, row):
+        return self.applications[self.app_codes[row]], self.products[self.product_codes[row]]
+
+    def select(self, rows) -> "SeriesCalendar":
+        """The calendar with only `rows` (indices or a boolean mask), same days."""
+        return SeriesCalendar(self.app_codes[rows], self.product_codes[rows], self.applications, self.products,
+                              self.dates, self.values[rows], self.observed[rows], self.gap_policy)
+
+    def spans(self) -> dict:
+        """{(first, last): rows} -- the series of one span are one 2-D slice of `values`."""
+        span_keys = self.first.astype(np.int64) * (len(self.dates) + 1) + self.last
+        unique, inverse = np.unique(span_keys, return_inverse=True)
+        return {(int(k // (len(self.dates) + 1)), int(k % (len(self.dates) + 1))): np.flatnonzero(inverse == i)
+                for i, k in enumerate(unique)}
+
+    def iter_series(self):
+        """(app, product, daily pd.Series) per row, for fitting one series at a time."""
+        for row in range(len(self)):
+            first, last = self.first[row], self.last[row]
+            app, product = self.key(row)
+            yield app, product, pd.Series(self.values[row, first:last + 1],
+                                          index=pd.DatetimeIndex(self.dates[first:last + 1], freq="D"))
+
+    def residual_matrix(self, resid: np.ndarray, rows=None) -> ResidualMatrix:
+        """
+        ResidualMatrix of a (series × days) residual array on this calendar, for
+        `rows` (default all) in the given order; each series is moved to start in
+        column 0. Under the mask policy the gap days are dropped.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        lengths = self.lengths[rows]
+        width = int(lengths.max()) if len(rows) else 0
+        dates = np.full((len(rows), width), np.datetime64("NaT"), dtype=self.dates.dtype)
+        values = np.full((len(rows), width), np.nan)
+        for (first, last), members in self.select(rows).spans().items():
+            source = rows[members]
+            block = resid[source, first:last + 1]
+            block_dates = np.broadcast_to(self.dates[first:last + 1], block.shape)
+            if self.gap_policy == "mask":
+                gap = ~self.observed[source, first:last + 1]
+                block = np.where(gap, np.nan, block)
+                block_dates = np.where(gap, np.datetime64("NaT"), block_dates)
+            values[members, :last - first + 1] = block
+            dates[members, :last - first + 1] = block_dates
+        keys = pd.MultiIndex(levels=[self.applications, self.products],
+                             codes=[self.app_codes[rows], self.product_codes[rows]])
+        return ResidualMatrix(keys, dates, values)
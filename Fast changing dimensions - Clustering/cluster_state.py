@@ -0,0 +1,56 @@
+import os
+import pickle
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import atomic_pickle
+
+# ---------- Saved clustering state ----------
+# Per clustering (output column): the fitted scaler, the centroids of the last
+# full KMeans fit in scaled space, the raw feature row every application was
+# last assigned with, its label and its distance to that centroid, and the mean
+# distance right after the full fit (reference_distance). An application whose
+# feature row changed is moved to its nearest saved centroid, O(k) per row; the
+# mean distance over all applications against reference_distance tells when
+# the saved clusters no longer describe the data.
+
+
+def nearest_centroid(X_scaled, centroids):
+    """Label of and Euclidean distance to the nearest centroid, per row."""
+    distances = np.linalg.norm(X_scaled[:, None, :] - centroids[None, :, :], axis=2)
+    labels = distances.argmin(axis=1)
+    return labels, distances[np.arange(len(labels)), labels]
+
+
+def align_labels(previous_centroids, previous_ids, centroids) -> np.ndarray:
+    """
+    Id for every cluster of a refit, so that clusters keep the id of the closest
+    previous cluster (Hungarian matching on centroid distances, both in the same
+    space). Clusters without a previous match get the smallest ids not in use.
+    """
+    cost = np.linalg.norm(centroids[:, None, :] - previous_centroids[None, :, :], axis=2)
+    new, old = linear_sum_assignment(cost)
+    ids = np.full(len(centroids), -1)
+    ids[new] = np.asarray(previous_ids)[old]
+    taken = set(ids[new].tolist())
+    free = (i for i in range(len(centroids) + len(previous_centroids)) if i not in taken)
+    for i in np.flatnonzero(ids == -1):
+        ids[i] = next(free)
+    return ids
+
+
+class ClusterStateStore:
+    """Pickled {clustering name: state dict} on local disk."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, states: dict):
+        atomic_pickle.dump(states, self.path)
@@ -1,10 +1,21 @@
 import os
+import sys
+import time
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import silhouette_score
+from sklearn.metrics import adjusted_rand_score
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "shared"))
+import cli
+import stage_profiler
+import report_rendering
+from cost_frame import CostFrame, CostMatrixCache, read_cost_rows, write_parquet_parts
+from cluster_state import ClusterStateStore, align_labels, nearest_centroid
+from silhouette_sweep import (DEFAULT_BATCH_SIZE, DEFAULT_SAMPLE_SIZE, KMeansSweep, MiniBatchKMeansSweep,
+                              matrix_digest)
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', None)
@@ -29,6 +40,16 @@ APPLICATIONS = [
     "MonitoringDashboard", "BackupService", "NotificationHub", "OnboardingTool", "TimeTracking"
 ]
 
+# Large-scale mode: MiniBatchKMeans and a silhouette on a sample of applications.
+# large_scale="auto" switches to it once there are as many applications as the
+# sample holds: the exact path's silhouettes cost O(n²) distances per k (computed
+# in bounded chunks, see silhouette_sweep.py), which the sample caps.
+LARGE_SCALE_MIN_APPS = DEFAULT_SAMPLE_SIZE
+
+# Online mode: recluster once the mean distance of the applications to their
+# saved centroids is this much (relative) above the one right after the last fit
+RECLUSTER_DRIFT = 0.25
+
 # ---------- Manual cluster name mapping ----------
 CLUSTER_NAME_MAPPING = {
     0: "A",
@@ -41,92 +62,290 @@ CLUSTER_NAME_MAPPING = {
 
 # ---------- Dummy Data Generator ----------
 class DummyDataGenerator:
+    """
+    Daily costs per application × service: application base + service base +
+    noise, built as one array per chunk of applications from a local
+    np.random.Generator. The data depends on the seed and on apps_per_chunk
+    (one chunk by default).
+    """
+
     def __init__(self, apps, services, days=42, seed=RANDOM_SEED):
-        self.apps = apps
-        self.services = services
+        self.apps = list(apps)
+        self.services = list(services)
         self.days = days
-        np.random.seed(seed)
+        self.seed = seed
+
+    @classmethod
+    def at_scale(cls, n_apps, n_services, days=42, seed=RANDOM_SEED):
+        """Synthetic names for load tests, e.g. at_scale(100_000, 12)."""
+        apps = [f"App{i:06d}" for i in range(n_apps)]
+        services = [f"Service{j:03d}" for j in range(n_services)]
+        return cls(apps, services, days=days, seed=seed)
+
+    def iter_chunks(self, apps_per_chunk=None, cost_dtype=np.float64):
+        """Yield one CostFrame per `apps_per_chunk` applications (codes index all apps)."""
+        rng = np.random.default_rng(self.seed)
+        apps_per_chunk = apps_per_chunk or max(len(self.apps), 1)
+        n_services = len(self.services)
+        for first in range(0, len(self.apps), apps_per_chunk):
+            n_apps = min(apps_per_chunk, len(self.apps) - first)
+            app_base = rng.uniform(500, 2000, (n_apps, 1, 1))
+            service_base = rng.uniform(50, 500, (n_apps, n_services, 1))
+            values = app_base + service_base + rng.normal(0, 50, (n_apps, n_services, self.days))
+            yield CostFrame(
+                app_codes=np.repeat(np.arange(first, first + n_apps, dtype=np.int32), n_services * self.days),
+                product_codes=np.tile(np.repeat(np.arange(n_services, dtype=np.int32), self.days), n_apps),
+                costs=values.ravel().astype(cost_dtype, copy=False),
+                applications=self.apps,
+                products=self.services
+            )
+
+    def to_parquet(self, directory, apps_per_chunk=10_000, cost_dtype=np.float32):
+        """Write the dataset as Parquet part files without holding it in memory."""
+        return write_parquet_parts(self.iter_chunks(apps_per_chunk, cost_dtype), directory)
 
     def generate(self):
-        data = []
-        for app in self.apps:
-            app_base = np.random.uniform(500, 2000)
-            for service in self.services:
-                service_base = np.random.uniform(50, 500)
-                values = app_base + service_base + np.random.normal(0, 50, self.days)
-                for v in values:
-                    data.append([app, service, v])
-        df = pd.DataFrame(data, columns=["application_name", "product_name", "eur_total_costs"])
-        return df
+        frames = [chunk.to_pandas() for chunk in self.iter_chunks()]
+        if not frames:
+            return pd.DataFrame(columns=["application_name", "product_name", "eur_total_costs"])
+        df = pd.concat(frames, ignore_index=True)
+        return df.astype({"application_name": object, "product_name": object})
 
 # ---------- Data Transformation ----------
 class DataTransformer:
     @staticmethod
-    def pivot_costs(df: pd.DataFrame) -> pd.DataFrame:
-        pivot = df.pivot_table(
-            index="application_name",
-            columns="product_name",
-            values="eur_total_costs",
-            aggfunc="sum",
-            fill_value=0
-        )
-        pivot["total_cost"] = pivot.sum(axis=1)
+    def pivot_costs(df) -> pd.DataFrame:
+        # A CostFrame sums on its integer codes instead of hashing name strings,
+        # a CostMatrixCache already holds the sums
+        with stage_profiler.stage("pivoting"):
+            if isinstance(df, CostMatrixCache):
+                pivot = df.pivot().copy()
+            elif isinstance(df, CostFrame):
+                pivot = df.pivot()
+            else:
+                pivot = df.pivot_table(
+                    index="application_name",
+                    columns="product_name",
+                    values="eur_total_costs",
+                    aggfunc="sum",
+                    fill_value=0
+                )
+            pivot["total_cost"] = pivot.sum(axis=1)
         return pivot
 
     @staticmethod
-    def normalize_to_percentage(pivot: pd.DataFrame) -> pd.DataFrame:
-        pivot_pct = pivot.div(pivot["total_cost"], axis=0).fillna(0) * 100
-        pivot_pct["total_cost"] = 100.0
+    def normalize_to_percentage(pivot) -> pd.DataFrame:
+        with stage_profiler.stage("normalize"):
+            if isinstance(pivot, CostMatrixCache):
+                pivot_pct = pivot.percentages().copy()
+            else:
+                pivot_pct = pivot.div(pivot["total_cost"], axis=0).fillna(0) * 100
+            pivot_pct["total_cost"] = 100.0
         return pivot_pct
 
 # ---------- Clustering ----------
 class ClusterAnalyzer:
-    def __init__(self, random_state=RANDOM_SEED):
+    def __init__(self, random_state=RANDOM_SEED, cache_dir=None, large_scale="auto",
+                 sample_size=DEFAULT_SAMPLE_SIZE, batch_size=DEFAULT_BATCH_SIZE):
         self.random_state = random_state
+        self.cache_dir = cache_dir  # persist fitted sweeps across runs when set
+        self.large_scale = large_scale  # True, False or "auto"
+        self.sample_size = sample_size  # silhouette sample in large-scale mode, drawn with random_state
+        self.batch_size = batch_size
+        self._sweeps = {}  # matrix digest -> KMeansSweep
+
+    def sweep_for(self, X) -> KMeansSweep:
+        """The KMeansSweep of a feature matrix, shared by the clustering and the silhouette plots."""
+        digest = matrix_digest(X)
+        if digest not in self._sweeps:
+            large = len(X) >= LARGE_SCALE_MIN_APPS if self.large_scale == "auto" else self.large_scale
+            if large:
+                sweep = MiniBatchKMeansSweep(X, self.random_state, cache_dir=self.cache_dir,
+                                             sample_size=self.sample_size, batch_size=self.batch_size)
+            else:
+                sweep = KMeansSweep(X, self.random_state, n_init=10, cache_dir=self.cache_dir)
+            self._sweeps[digest] = sweep
+        return self._sweeps[digest]
 
     def cluster_by_total_cost(self, pivot: pd.DataFrame, n_clusters=6):
-        X = np.log1p(pivot[["total_cost"]].values)
-        X_scaled = StandardScaler().fit_transform(X)
-        kmeans = KMeans(n_clusters=n_clusters, random_state=self.random_state, n_init=10)
-        pivot["cluster_total_cost"] = kmeans.fit_predict(X_scaled)
+        with stage_profiler.stage("scaling"):
+            X = np.log1p(pivot[["total_cost"]].values)
+            X_scaled = StandardScaler().fit_transform(X)
+        with stage_profiler.stage("kmeans"):
+            pivot["cluster_total_cost"] = self.sweep_for(X_scaled).labels(n_clusters)
         return pivot, X_scaled
 
-    def cluster_by_usage_pattern(self, pivot: pd.DataFrame, pivot_pct: pd.DataFrame, n_clusters=6):
-        X_scaled = StandardScaler().fit_transform(pivot_pct[AWS_SERVICES].values)
-        kmeans = KMeans(n_clusters=n_clusters, random_state=self.random_state, n_init=10)
-        pivot["cluster_usage_pattern"] = kmeans.fit_predict(X_scaled)
+    def cluster_by_usage_pattern(self, pivot: pd.DataFrame, pivot_pct: pd.DataFrame, n_clusters=6,
+                                 products=AWS_SERVICES):
+        """`products`: the pivot_pct columns the usage pattern is made of."""
+        with stage_profiler.stage("scaling"):
+            X_scaled = StandardScaler().fit_transform(pivot_pct[products].values)
+        with stage_profiler.stage("kmeans"):
+            pivot["cluster_usage_pattern"] = self.sweep_for(X_scaled).labels(n_clusters)
         return pivot, X_scaled
 
-    def silhouette_analysis(self, X, k_range, title):
+    def _refit(self, raw: pd.DataFrame, n_clusters, previous):
+        scaler = StandardScaler().fit(raw.values)
+        X_scaled = scaler.transform(raw.values)
+        model = self.sweep_for(X_scaled).fit(n_clusters)
+        centroids = model.cluster_centers_
+        cluster_ids = np.arange(len(centroids))
+        if previous is not None and previous["features"].columns.equals(raw.columns):
+            # both sets of centroids in the new scaled space
+            previous_centroids = scaler.transform(previous["scaler"].inverse_transform(previous["centroids"]))
+            cluster_ids = align_labels(previous_centroids, previous["cluster_ids"], centroids)
+        distances = np.linalg.norm(X_scaled - centroids[model.labels_], axis=1)
+        return {
+            "n_clusters": n_clusters,
+            "scaler": scaler,
+            "centroids": centroids,
+            "cluster_ids": cluster_ids,
+            "features": raw.copy(),
+            "labels": pd.Series(cluster_ids[model.labels_], index=raw.index),
+            "distances": pd.Series(distances, index=raw.index),
+            "reference_distance": distances.mean(),
+        }
+
+    def _assign_changed(self, state, raw: pd.DataFrame):
+        """Move new and changed rows to their nearest saved centroid; returns (state, changed count, drift)."""
+        previous = state["features"].reindex(raw.index)
+        changed = (previous != raw).any(axis=1).to_numpy()  # new applications compare as NaN
+        labels = state["labels"].reindex(raw.index)
+        distances = state["distances"].reindex(raw.index)
+        if changed.any():
+            nearest, distance = nearest_centroid(state["scaler"].transform(raw.values[changed]), state["centroids"])
+            labels[changed] = state["cluster_ids"][nearest]
+            distances[changed] = distance
+        state = {**state, "features": raw.copy(), "labels": labels.astype(int), "distances": distances}
+        reference = state["reference_distance"]
+        drift = float(distances.mean() / reference - 1) if reference > 0 else 0.0
+        return state, int(changed.sum()), drift
+
+    def cluster_online(self, pivot: pd.DataFrame, pivot_pct: pd.DataFrame, state_path, n_clusters=6,
+                       drift_threshold=RECLUSTER_DRIFT, products=AWS_SERVICES):
+        """
+        cluster_by_total_cost and cluster_by_usage_pattern against the state of the
+        previous run (see cluster_state.py). New and changed applications go to the
+        nearest saved centroid. A clustering is refit on all applications when it
+        has no state yet, its features or k changed, or its drift passes
+        drift_threshold; refit ids are aligned to the previous ones, so
+        CLUSTER_NAME_MAPPING keeps naming the same groups. What happened per
+        clustering is left in self.online_report.
+        """
+        store = ClusterStateStore(state_path)
+        states = store.load()
+        features = {
+            "cluster_total_cost": np.log1p(pivot[["total_cost"]]),
+            "cluster_usage_pattern": pivot_pct[products],
+        }
+        scaled = {}
+        self.online_report = {}
+        for column, raw in features.items():
+            state = states.get(column)
+            if state is None or state["n_clusters"] != n_clusters or not state["features"].columns.equals(raw.columns):
+                report = {"mode": "refit", "changed": len(raw), "drift": None}
+            else:
+                with stage_profiler.stage("online_assign"):
+                    state, changed, drift = self._assign_changed(state, raw)
+                report = {"mode": "incremental" if drift <= drift_threshold else "refit", "changed": changed, "drift": drift}
+            if report["mode"] == "refit":
+                with stage_profiler.stage("kmeans"):
+                    state = self._refit(raw, n_clusters, state)
+            states[column] = state
+            pivot[column] = state["labels"].to_numpy()
+            scaled[column] = state["scaler"].transform(raw.values)
+            self.online_report[column] = report
+        store.save(states)
+        return pivot, scaled["cluster_total_cost"], scaled["cluster_usage_pattern"]
+
+    def agreement_with_exact(self, pivot: pd.DataFrame, pivot_pct: pd.DataFrame, n_clusters=6,
+                             products=AWS_SERVICES) -> dict:
+        """
+        Adjusted Rand index of the large-scale labels against the exact ones for
+        both clusterings (1.0 = the same partition up to renumbering). Runs both
+        paths, so use it on inputs the exact path can handle.
+        """
+        labels = []
+        for large_scale in (False, True):
+            analyzer = ClusterAnalyzer(self.random_state, large_scale=large_scale,
+                                       sample_size=self.sample_size, batch_size=self.batch_size)
+            result, _ = analyzer.cluster_by_total_cost(pivot[["total_cost"]].copy(), n_clusters)
+            result, _ = analyzer.cluster_by_usage_pattern(result, pivot_pct, n_clusters, products)
+            labels.append(result)
+        exact, large = labels
+        return {column: adjusted_rand_score(exact[column], large[column])
+                for column in ("cluster_total_cost", "cluster_usage_pattern")}
+
+    def silhouette_analysis(self, X, k_range, title, output=None, plot=True):
+        """
+        Silhouette score per k, returned as a list. The curve is shown in a window,
+        or written headless to `output` (.png / .svg); plot=False only scores.
+        """
+        sweep = self.sweep_for(X)
         scores = []
-        for k in k_range:
-            kmeans = KMeans(n_clusters=k, random_state=self.random_state, n_init=10).fit(X)
-            scores.append(silhouette_score(X, kmeans.labels_))
-        plt.figure(figsize=(8,5))
-        plt.plot(k_range, scores, marker="o")
-        plt.xlabel("Number of clusters (k)")
-        plt.ylabel("Silhouette Score")
-        plt.title(title)
+        with stage_profiler.stage("silhouette"):
+            for k in k_range:
+                start = time.perf_counter()
+                scores.append(sweep.score(k))
+                stage_profiler.record_item("silhouette", f"{title}: k={k}", time.perf_counter() - start)
+        if not plot:
+            return scores
+        with stage_profiler.stage("plotting"):
+            plt = report_rendering.pyplot(headless=output is not None)
+            fig = plt.figure(figsize=(8,5))
+            plt.plot(k_range, scores, marker="o")
+            plt.xlabel("Number of clusters (k)")
+            plt.ylabel("Silhouette Score")
+            plt.title(title)
+            if output is not None:
+                report_rendering.save_figure(fig, output)
+                plt.close(fig)
+                return scores
         plt.show()
+        return scores
 
 # ---------- Main ----------
-def main():
-    out_dir = "./output"
+def parse_args(argv=None):
+    parser = cli.base_parser("Cluster applications by total cost and by usage pattern.")
+    parser.add_argument("--out-dir", default="./output", help="CSV summaries and cluster state")
+    parser.add_argument("--cache-dir", help="keep KMeans fits and silhouettes here between runs")
+    parser.add_argument("--n-clusters", type=int, default=6)
+    parser.add_argument("--large-scale", choices=("auto", "on", "off"), default="auto",
+                        help=f"mini-batch KMeans and sampled silhouettes (auto: from {LARGE_SCALE_MIN_APPS} apps on)")
+    parser.add_argument("--no-plots", action="store_true", help="skip the silhouette plots")
+    return cli.parse(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    out_dir = args.out_dir
     os.makedirs(out_dir, exist_ok=True)
 
-    # --- Generate dummy data ---
-    generator = DummyDataGenerator(APPLICATIONS, AWS_SERVICES)
-    df = generator.generate()
+    # --- Generate dummy data (or read --input) ---
+    with stage_profiler.stage("generate"):
+        if args.input:
+            df = read_cost_rows(args.input)
+            products = list(df.products)  # the usage features are the products in the input
+        else:
+            df = DummyDataGenerator(APPLICATIONS, AWS_SERVICES).generate()
+            products = AWS_SERVICES
 
     # --- Transform data ---
+    # the sums are kept in a CostMatrixCache; new cost rows go in with matrix.update(rows)
     transformer = DataTransformer()
-    pivot = transformer.pivot_costs(df)
-    pivot_pct = transformer.normalize_to_percentage(pivot)
+    matrix = CostMatrixCache.from_rows(df)
+    pivot = transformer.pivot_costs(matrix)
+    pivot_pct = transformer.normalize_to_percentage(matrix)
 
     # --- Clustering ---
-    analyzer = ClusterAnalyzer()
-    pivot, X_cost = analyzer.cluster_by_total_cost(pivot)
-    pivot, X_usage = analyzer.cluster_by_usage_pattern(pivot, pivot_pct)
+    large_scale = {"auto": "auto", "on": True, "off": False}[args.large_scale]
+    analyzer = ClusterAnalyzer(cache_dir=args.cache_dir, large_scale=large_scale)
+    # only new or changed applications are assigned, see cluster_online
+    pivot, X_cost, X_usage = analyzer.cluster_online(pivot, pivot_pct, os.path.join(out_dir, "cluster_state.pkl"),
+                                                     n_clusters=args.n_clusters, products=products)
+    for column, report in analyzer.online_report.items():
+        drift = "" if report["drift"] is None else f", drift {report['drift']:+.2f}"
+        print(f"{column}: {report['mode']} ({report['changed']} applications assigned{drift})")
 
     # --- Summary Table ---
     summary_table = pivot.reset_index()[[
@@ -142,29 +361,33 @@ def main():
     print(summary_table.to_string(index=False))  # ✅ no row numbers when printing
 
     # --- Top 3 products per cluster normalized ---
-    top_products_summary = []
-    clusters = pivot['cluster_usage_pattern'].unique()
-    for cluster in sorted(clusters):
-        cluster_data = pivot[pivot['cluster_usage_pattern'] == cluster]
-        cluster_pct = cluster_data[AWS_SERVICES].div(cluster_data[AWS_SERVICES].sum(axis=1), axis=0).fillna(0) * 100
-        top_products = cluster_pct.mean().sort_values(ascending=False).head(3)
-        for product in top_products.index:
-            top_products_summary.append({
-                "cluster_usage_pattern": cluster,
-                "given_cluster_name": CLUSTER_NAME_MAPPING.get(cluster, ""),
-                "subscription": product,
-                "mean_percentage": top_products[product]
-            })
-
-    top_products_df = pd.DataFrame(top_products_summary)
+    # the rows of pivot_pct are already each application's % per product, so the
+    # mean share per cluster is one groupby
+    with stage_profiler.stage("top_products"):
+        mean_pct = pivot_pct[products].groupby(pivot['cluster_usage_pattern']).mean()
+        top_products_df = (
+            mean_pct.rename_axis(columns="subscription").stack().rename("mean_percentage").reset_index()
+            .sort_values(["cluster_usage_pattern", "mean_percentage"], ascending=[True, False], kind="stable")
+            .groupby("cluster_usage_pattern").head(3)
+            .reset_index(drop=True)
+        )
+        top_products_df.insert(1, "given_cluster_name",
+                               top_products_df["cluster_usage_pattern"].map(CLUSTER_NAME_MAPPING).fillna(""))
     top_products_csv = os.path.join(out_dir, "top3_products_per_cluster.csv")
     top_products_df.to_csv(top_products_csv, index=False, float_format="%.2f")  # ✅ no row numbers in CSV
     print("\nSaved Top 3 products per cluster (normalized) CSV to:", top_products_csv)
     print(top_products_df.to_string(index=False))  # ✅ no row numbers when printing
 
     # --- Silhouette plots ---
-    analyzer.silhouette_analysis(X_cost, range(2, 10), "Silhouette Analysis - Total Cost")
-    analyzer.silhouette_analysis(X_usage, range(2, 10), "Silhouette Analysis - Usage Pattern")
+    if args.no_plots:
+        return
+    report_dir = args.report_dir  # --report-dir / COST_REPORT_DIR: write files, no window
+    for X, title, name in [(X_cost, "Silhouette Analysis - Total Cost", "silhouette_total_cost"),
+                           (X_usage, "Silhouette Analysis - Usage Pattern", "silhouette_usage_pattern")]:
+        output = None if report_dir is None else os.path.join(report_dir, f"{name}.png")
+        analyzer.silhouette_analysis(X, range(2, 10), title, output)
+        if output is not None:
+            print("Saved", output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import sklearn
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
+
+import atomic_pickle
+
+# ---------- Cached KMeans / silhouette sweeps ----------
+# A silhouette sweep fits KMeans for every k and scores each labelling, and
+# silhouette_score recomputes all pairwise distances on every call. A
+# KMeansSweep belongs to one feature matrix: up to PRECOMPUTED_MAX_ROWS rows
+# the distance matrix is computed once and shared by all scores (above that it
+# would be n² floats, so every score goes through silhouette_score's chunked
+# distances, SILHOUETTE_WORKING_MEMORY_MB at a time, and nothing is kept),
+# fitted models are kept so that the final
+# clustering at the chosen k reuses the sweep's fit, and with a cache_dir every
+# (matrix, k, settings) result is pickled under a hash of its inputs, so a rerun
+# on unchanged data loads instead of refitting.
+#
+# Large populations: full-batch KMeans rereads X every iteration. With sample_size the silhouette is computed on a
+# fixed random sample of rows (drawn with random_state, the same sample for
+# every k), and MiniBatchKMeansSweep fits on mini-batches of batch_size rows
+# while still labelling every row.
+DEFAULT_SAMPLE_SIZE = 10_000
+PRECOMPUTED_MAX_ROWS = 4000  # 4000² float64 distances: 128 MB
+SILHOUETTE_WORKING_MEMORY_MB = 64  # distance chunk size above that (sklearn's default is 1024)
+DEFAULT_BATCH_SIZE = 4096
+
+
+def matrix_digest(X) -> str:
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    digest = hashlib.sha256(str(X.shape).encode())
+    digest.update(X.tobytes())
+    return digest.hexdigest()
+
+
+class KMeansSweep:
+    def __init__(self, X, random_state=0, n_init=10, cache_dir=None, sample_size=None):
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        self.random_state = random_state
+        self.n_init = n_init
+        self.cache_dir = cache_dir
+        self.digest = matrix_digest(self.X)
+        self.sample = None  # row indices the silhouette is computed on, None for all rows
+        if sample_size is not None and sample_size < len(self.X):
+            rng = np.random.default_rng(random_state)
+            self.sample = np.sort(rng.choice(len(self.X), size=sample_size, replace=False))
+        self._distances = None
+        self._results = {}  # k -> {"model": KMeans, "score": float or None}
+
+    @property
+    def scored_rows(self) -> np.ndarray:
+        """The rows silhouettes are computed on: X, or its sample."""
+        return self.X if self.sample is None else self.X[self.sample]
+
+    @property
+    def distances(self):
+        """
+        Euclidean distance matrix of the scored rows, computed on first use;
+        None above PRECOMPUTED_MAX_ROWS rows.
+        """
+        if self._distances is None and len(self.X if self.sample is None else self.sample) <= PRECOMPUTED_MAX_ROWS:
+            self._distances = pairwise_distances(self.scored_rows)
+        return self._distances
+
+    def _model(self, k):
+        return KMeans(n_clusters=k, random_state=self.random_state, n_init=self.n_init)
+
+    def _settings(self) -> str:
+        sample = "all" if self.sample is None else len(self.sample)
+        return f"{type(self).__name__}|seed={self.random_state}|n_init={self.n_init}|sample={sample}"
+
+    def _cache_path(self, k):
+        settings = f"{self.digest}|k={k}|{self._settings()}|sklearn={sklearn.__version__}"
+        name = hashlib.sha256(settings.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"kmeans_{name}.pkl")
+
+    def _result(self, k):
+        if k in self._results:
+            return self._results[k]
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(k), "rb") as f:
+                    self._results[k] = pickle.load(f)
+                return self._results[k]
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        model = self._model(k).fit(self.X)
+        self._results[k] = {"model": model, "score": None}
+        self._save(k)
+        return self._results[k]
+
+    def _save(self, k):
+        if self.cache_dir:
+            atomic_pickle.dump(self._results[k], self._cache_path(k))
+
+    def fit(self, k) -> KMeans:
+        """Fitted KMeans for k, from this sweep, the disk cache or a new fit."""
+        return self._result(k)["model"]
+
+    def labels(self, k) -> np.ndarray:
+        return self.fit(k).labels_
+
+    def silhouette(self, labels) -> float:
+        """Silhouette score of any labelling of X (sampled rows only), on the shared distances when small."""
+        if self.sample is not None:
+            labels = np.asarray(labels)[self.sample]
+        distances = self.distances
+        if distances is None:
+            with sklearn.config_context(working_memory=SILHOUETTE_WORKING_MEMORY_MB):
+                return silhouette_score(self.scored_rows, labels)  # distances computed chunk by chunk
+        return silhouette_score(distances, labels, metric="precomputed")
+
+    def score(self, k) -> float:
+        result = self._result(k)
+        if result["score"] is None:
+            result["score"] = float(self.silhouette(result["model"].labels_))
+            self._save(k)
+        return result["score"]
+
+    def sweep(self, k_range) -> list:
+        return [self.score(k) for k in k_range]
+
+
+class MiniBatchKMeansSweep(KMeansSweep):
+    """KMeansSweep for large X: MiniBatchKMeans fits and a sampled silhouette."""
+
+    def __init__(self, X, random_state=0, n_init=3, cache_dir=None, sample_size=DEFAULT_SAMPLE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        super().__init__(X, random_state, n_init, cache_dir, sample_size)
+
+    def _model(self, k):
+        return MiniBatchKMeans(n_clusters=k, random_state=self.random_state, n_init=self.n_init,
+                               batch_size=self.batch_size)
+
+    def _settings(self) -> str:
+        return f"{super()._settings()}|batch_size={self.batch_size}"
@@ -1,4 +1,9 @@
 # Quick and Dirty Simple Example 
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
@@ -6,27 +11,57 @@ from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans, AgglomerativeClustering, DBSCAN
 from sklearn.mixture import GaussianMixture
 from sklearn.metrics import silhouette_score
-import networkx as nx
+import sklearn.cluster
 import warnings
 
+sys.path.append(str(Path(__file__).resolve().parents[1] / "shared"))
+import cli
+import optional_deps
+import stage_profiler
+from cost_frame import CostFrame, CostMatrixCache, read_cost_rows, write_parquet_parts
+from silhouette_sweep import KMeansSweep
+
 # ----------------- Dummy Data Generator -----------------
 class DummyDataGenerator:
     def __init__(self, applications, services, days=30, seed=42):
-        self.applications = applications
-        self.services = services
+        self.applications = list(applications)
+        self.services = list(services)
         self.days = days
-        np.random.seed(seed)
+        self.seed = seed
+
+    @classmethod
+    def at_scale(cls, n_applications, n_services, days=30, seed=42):
+        applications = [f"App{i:06d}" for i in range(n_applications)]
+        services = [f"Service{j:03d}" for j in range(n_services)]
+        return cls(applications, services, days=days, seed=seed)
+
+    def iter_chunks(self, apps_per_chunk=None, cost_dtype=np.float64):
+        # One (apps × services × days) array per chunk from a local generator
+        rng = np.random.default_rng(self.seed)
+        apps_per_chunk = apps_per_chunk or max(len(self.applications), 1)
+        n_services = len(self.services)
+        for first in range(0, len(self.applications), apps_per_chunk):
+            n_apps = min(apps_per_chunk, len(self.applications) - first)
+            base = rng.uniform(500, 2000, (n_apps, 1, 1))
+            svc_base = rng.uniform(50, 500, (n_apps, n_services, 1))
+            values = base + svc_base + rng.normal(0, 50, (n_apps, n_services, self.days))
+            yield CostFrame(
+                app_codes=np.repeat(np.arange(first, first + n_apps, dtype=np.int32), n_services * self.days),
+                product_codes=np.tile(np.repeat(np.arange(n_services, dtype=np.int32), self.days), n_apps),
+                costs=values.ravel().astype(cost_dtype, copy=False),
+                applications=self.applications,
+                products=self.services
+            )
+
+    def to_parquet(self, directory, apps_per_chunk=10_000, cost_dtype=np.float32):
+        return write_parquet_parts(self.iter_chunks(apps_per_chunk, cost_dtype), directory)
 
     def generate(self):
-        data = []
-        for app in self.applications:
-            base = np.random.uniform(500, 2000)
-            for svc in self.services:
-                svc_base = np.random.uniform(50, 500)
-                values = base + svc_base + np.random.normal(0, 50, self.days)
-                for v in values:
-                    data.append([app, svc, v])
-        return pd.DataFrame(data, columns=["application_name", "product_name", "eur_total_costs"])
+        frames = [chunk.to_pandas() for chunk in self.iter_chunks()]
+        if not frames:
+            return pd.DataFrame(columns=["application_name", "product_name", "eur_total_costs"])
+        df = pd.concat(frames, ignore_index=True)
+        return df.astype({"application_name": object, "product_name": object})
 
 # ----------------- Data Transformation -----------------
 class DataTransformer:
@@ -36,32 +71,193 @@ class DataTransformer:
         self.X = None
 
     def pivot_data(self):
-        self.pivot = self.df.pivot_table(
-            index="application_name",
-            columns="product_name",
-            values="eur_total_costs",
-            aggfunc="sum",
-            fill_value=0
-        )
+        with stage_profiler.stage("pivoting"):
+            if isinstance(self.df, CostMatrixCache):
+                self.pivot = self.df.pivot().copy()
+                return self.pivot
+            if isinstance(self.df, CostFrame):
+                self.pivot = self.df.pivot()
+                return self.pivot
+            self.pivot = self.df.pivot_table(
+                index="application_name",
+                columns="product_name",
+                values="eur_total_costs",
+                aggfunc="sum",
+                fill_value=0
+            )
         return self.pivot
 
     def scale_features(self):
-        self.X = StandardScaler().fit_transform(self.pivot.values)
+        with stage_profiler.stage("scaling"):
+            if isinstance(self.df, CostMatrixCache):
+                self.X = self.df.scaled()
+            else:
+                self.X = StandardScaler().fit_transform(self.pivot.values)
         return self.X
 
+# ----------------- Similarity graph -----------------
+# Louvain works on a graph with an edge between two applications whose cost
+# profiles have a cosine similarity above LOUVAIN_SIMILARITY. The similarities
+# are computed a block of rows at a time (about SIMILARITY_BLOCK_ENTRIES values
+# each) and only the pairs above the threshold are kept, so there is never a
+# dense n × n matrix; the graph is then built in one call from the edge arrays.
+# Cost profiles are often alike, so above the threshold alone the edge count can
+# still grow with n²: with max_neighbors every application keeps only its most
+# similar neighbours (a pair is an edge when either side keeps it). Populations
+# up to max_neighbors + 1 get exactly the thresholded graph.
+LOUVAIN_SIMILARITY = 0.5
+LOUVAIN_MAX_NEIGHBORS = 50
+SIMILARITY_BLOCK_ENTRIES = 2048 * 2048
+
+
+def similarity_edges(X, threshold=LOUVAIN_SIMILARITY, max_neighbors=None, block_entries=SIMILARITY_BLOCK_ENTRIES):
+    """Arrays (i, j, similarity), i < j, of the pairs with cosine similarity above threshold."""
+    X = np.asarray(X, dtype=np.float64)
+    norms = np.linalg.norm(X, axis=1)
+    X = X / np.where(norms == 0, 1.0, norms)[:, None]  # zero rows stay zero, as in cosine_similarity
+    n = len(X)
+    capped = max_neighbors is not None and max_neighbors < n - 1
+    block_rows = max(1, block_entries // max(n, 1))
+    rows, cols, weights = [], [], []
+    for start in range(0, n, block_rows):
+        block = X[start:start + block_rows]
+        local = np.arange(len(block))
+        if capped:
+            sim = block @ X.T
+            sim[local, local + start] = -np.inf  # no self loops
+            j = np.argpartition(sim, -max_neighbors, axis=1)[:, -max_neighbors:]
+            i = np.repeat(local, max_neighbors).reshape(j.shape)
+        else:
+            sim = block @ X[start:].T  # upper triangle: only columns from this block on
+            i, j = np.nonzero(sim > threshold)
+            i, j = i[j > i], j[j > i]
+        w = sim[i, j]
+        keep = w > threshold
+        i, j = i[keep] + start, j[keep] + (0 if capped else start)
+        rows.append(np.minimum(i, j))
+        cols.append(np.maximum(i, j))
+        weights.append(w[keep])
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    if capped:  # a pair kept by both ends appears twice
+        _, first = np.unique(rows.astype(np.int64) * n + cols, return_index=True)
+        rows, cols, weights = rows[first], cols[first], weights[first]
+    return rows, cols, weights
+
+# ----------------- Optional methods -----------------
+# HDBSCAN uses the hdbscan package when it is installed, else scikit-learn's
+# own HDBSCAN (scikit-learn >= 1.3). Louvain needs networkx for the graph and
+# uses python-louvain when it is installed, else networkx's louvain_communities.
+# The checks only look the packages up (once per process, see
+# optional_deps.py); networkx and hdbscan are imported by the method using them.
+def have_hdbscan() -> bool:
+    return optional_deps.available("hdbscan") or hasattr(sklearn.cluster, "HDBSCAN")
+
+
+def have_louvain() -> bool:
+    return optional_deps.available("networkx")
+
+
+def hdbscan_estimator(**params):
+    if optional_deps.available("hdbscan"):
+        return optional_deps.load("hdbscan").HDBSCAN(**params)
+    return sklearn.cluster.HDBSCAN(**params)
+
+
+def louvain_partition(G) -> dict:
+    """{node: community id} of a weighted networkx graph."""
+    if optional_deps.available("community"):
+        return optional_deps.load("community.community_louvain").best_partition(G, weight='weight')
+    import networkx as nx
+    communities = nx.community.louvain_communities(G, weight='weight', seed=0)
+    return {node: i for i, members in enumerate(communities) for node in members}
+
+# ----------------- Parallel model selection -----------------
+# ClusterAnalyzer.run_parallel evaluates every candidate (one method at one k or
+# n_components) as its own task on a process pool. At most n_jobs candidates
+# run at a time and a method's next one is only submitted while the method is
+# still worth running, round-robin over the methods. Agglomerative still uses
+# KMeans' best k, so it is submitted as soon as the KMeans candidates are in.
+# Two optional ways to cut a run short:
+# - time_budget: a method gets no further candidates once its finished ones used
+#   that many seconds of worker time, and a candidate still running when its
+#   method's budget is used up is stopped. That needs the pool's processes to be
+#   terminated; the other running candidates are then started again on a new
+#   pool. A method stopped before any of its candidates finished (DBSCAN,
+#   HDBSCAN and Louvain have only one) reports no result.
+# - early_stop_margin: a method gets no further candidates once its last
+#   EARLY_STOP_PATIENCE silhouettes are all more than the margin below the best
+#   silhouette seen so far. GMM then picks its BIC winner among fewer n.
+# With neither set the results equal run_all's.
+METHODS = ("KMeans", "Agglomerative", "GMM", "DBSCAN", "HDBSCAN", "Louvain")
+KMEANS_K_RANGE = (2, 6)
+GMM_MAX_COMPONENTS = 6
+EARLY_STOP_PATIENCE = 2
+
+_worker_data = None  # (X, names), set once per worker process
+
+
+def _init_worker(X, names):
+    global _worker_data
+    warnings.simplefilter("ignore")
+    _worker_data = (X, names)
+
+
+def _resolve_n_jobs(n_jobs) -> int:
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def _new_pool(n_jobs, X, names):
+    return ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(X, names))
+
+
+def _terminate_pool(executor):
+    """Shut a pool down without waiting for the candidates its workers are running."""
+    for process in list((executor._processes or {}).values()):  # no public way to stop a running task
+        process.terminate()
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_candidate(method, param):
+    """Fit one candidate in a worker: (method, param, silhouette, labels, bic, seconds)."""
+    X, names = _worker_data
+    start = time.perf_counter()
+    bic = None
+    if method == "KMeans":
+        labels = KMeans(n_clusters=param, random_state=0, n_init=10).fit_predict(X)
+    elif method == "Agglomerative":
+        labels = AgglomerativeClustering(n_clusters=param).fit_predict(X)
+    elif method == "GMM":
+        gm = GaussianMixture(n_components=param, random_state=0)
+        labels = gm.fit_predict(X)
+        bic = gm.bic(X)
+    else:
+        analyzer = ClusterAnalyzer(X, names)
+        getattr(analyzer, f"try_{method.lower()}")()
+        _, param, score, labels = analyzer.results[-1]
+        return method, param, score, labels, bic, time.perf_counter() - start
+    score = silhouette_score(X, labels) if len(set(labels)) > 1 else -1
+    return method, param, score, labels, bic, time.perf_counter() - start
+
 # ----------------- Cluster Analyzer -----------------
 class ClusterAnalyzer:
-    def __init__(self, X, names):
+    def __init__(self, X, names, cache_dir=None):
         self.X = X
         self.names = names
         self.results = []
+        # one distance matrix and one set of KMeans fits for every method below
+        self.sweep = KMeansSweep(X, random_state=0, n_init=10, cache_dir=cache_dir)
 
     def try_kmeans(self, k_range=(2,6)):
         best, best_k, best_score = None, None, -1
         for k in range(k_range[0], min(k_range[1], self.X.shape[0]-1)+1):
-            km = KMeans(n_clusters=k, random_state=0, n_init=10)
-            labels = km.fit_predict(self.X)
-            score = silhouette_score(self.X, labels)
+            start = time.perf_counter()
+            labels = self.sweep.labels(k)
+            score = self.sweep.score(k)
+            stage_profiler.record_item("KMeans", f"k={k}", time.perf_counter() - start)
             if score > best_score:
                 best, best_k, best_score = labels, k, score
         self.results.append(("KMeans", best_k, best_score, best))
@@ -71,18 +267,20 @@ class ClusterAnalyzer:
         if k is None: return
         ag = AgglomerativeClustering(n_clusters=k)
         labels = ag.fit_predict(self.X)
-        score = silhouette_score(self.X, labels)
+        score = self.sweep.silhouette(labels)
         self.results.append(("Agglomerative", k, score, labels))
 
     def try_gmm(self, max_components=6):
         best_bic, best_labels, best_n = np.inf, None, None
         for n in range(2, min(max_components, self.X.shape[0]-1)+1):
+            start = time.perf_counter()
             gm = GaussianMixture(n_components=n, random_state=0)
             labels = gm.fit_predict(self.X)
             bic = gm.bic(self.X)
+            stage_profiler.record_item("GMM", f"n={n}", time.perf_counter() - start)
             if bic < best_bic:
                 best_bic, best_labels, best_n = bic, labels, n
-        score = silhouette_score(self.X, best_labels) if best_labels is not None else -1
+        score = self.sweep.silhouette(best_labels) if best_labels is not None else -1
         self.results.append(("GMM", best_n, score, best_labels))
 
     def try_dbscan(self):
@@ -92,45 +290,137 @@ class ClusterAnalyzer:
         dists, _ = nbrs.kneighbors(self.X)
         eps = np.percentile(dists[:, -1], 80)
         labels = DBSCAN(eps=eps, min_samples=3).fit_predict(self.X)
-        score = silhouette_score(self.X, labels) if len(set(labels))>1 and -1 not in labels else -1
+        score = self.sweep.silhouette(labels) if len(set(labels))>1 and -1 not in labels else -1
         self.results.append(("DBSCAN", None, score, labels))
 
     def try_hdbscan(self):
-        if not HAVE_HDBSCAN:
+        if not have_hdbscan():
             self.results.append(("HDBSCAN", None, -1, None))
             return
-        labels = hdbscan.HDBSCAN(min_cluster_size=3).fit_predict(self.X)
+        labels = hdbscan_estimator(min_cluster_size=3).fit_predict(self.X)
         lab_valid = labels[labels!=-1]
         score = silhouette_score(self.X[labels!=-1], lab_valid) if len(set(lab_valid))>1 else -1
         self.results.append(("HDBSCAN", None, score, labels))
 
     def try_louvain(self):
-        if not HAVE_LOUVAIN:
+        if not have_louvain():
             self.results.append(("Louvain", None, -1, None))
             return
-        from sklearn.metrics.pairwise import cosine_similarity
-        sim = cosine_similarity(self.X)
+        import networkx as nx
+        i, j, weights = similarity_edges(self.X, max_neighbors=LOUVAIN_MAX_NEIGHBORS)
+        names = np.asarray(self.names, dtype=object)
         G = nx.Graph()
-        for i, a in enumerate(self.names):
-            for j, b in enumerate(self.names):
-                if i>=j: continue
-                if sim[i,j] > 0.5:
-                    G.add_edge(a, b, weight=sim[i,j])
+        G.add_weighted_edges_from(zip(names[i], names[j], weights.tolist()))
         if G.number_of_nodes() == 0:
             self.results.append(("Louvain", None, -1, None))
             return
-        part = community_louvain.best_partition(G, weight='weight')
+        part = louvain_partition(G)
         labels = np.array([part.get(n,-1) for n in self.names])
-        score = silhouette_score(self.X, labels) if len(set(labels))>1 and -1 not in labels else -1
+        # above PRECOMPUTED_MAX_ROWS the sweep scores in chunks, without an n×n matrix
+        score = self.sweep.silhouette(labels) if len(set(labels))>1 and -1 not in labels else -1
         self.results.append(("Louvain", None, score, labels))
 
-    def run_all(self):
-        self.try_kmeans()
-        self.try_agglomerative()
-        self.try_gmm()
-        self.try_dbscan()
-        self.try_hdbscan()
-        self.try_louvain()
+    def run_all(self, methods=METHODS):
+        for name in METHODS:
+            if name in methods:
+                with stage_profiler.stage(name):
+                    getattr(self, f"try_{name.lower()}")()
+        return self.results
+
+    def run_parallel(self, n_jobs=None, time_budget=None, early_stop_margin=None, methods=METHODS):
+        """run_all on a process pool; see the notes on parallel model selection above."""
+        n_jobs = _resolve_n_jobs(n_jobs)
+        max_k = self.X.shape[0] - 1
+        params = {
+            "KMeans": list(range(KMEANS_K_RANGE[0], min(KMEANS_K_RANGE[1], max_k) + 1)),
+            "GMM": list(range(2, min(GMM_MAX_COMPONENTS, max_k) + 1)),
+        }
+        queues = {m: list(params.get(m, [None])) for m in methods}  # method -> candidates not yet submitted
+        queues["Agglomerative"] = []  # filled once KMeans is done
+        done = {m: [] for m in methods}  # method -> [(param, score, labels, bic)] in completion order
+        spent = dict.fromkeys(methods, 0.0)
+        stopped = set()  # methods with a candidate stopped at their time budget
+        best = -np.inf
+        turn = 0
+
+        def exhausted(method):
+            if method in stopped or (time_budget is not None and spent[method] >= time_budget):
+                return True
+            recent = [score for _, score, _, _ in done[method][-EARLY_STOP_PATIENCE:]]
+            return (early_stop_margin is not None and len(recent) == EARLY_STOP_PATIENCE
+                    and max(recent) < best - early_stop_margin)
+
+        def next_candidate():
+            # round-robin over the methods, so every method reports early
+            nonlocal turn
+            for i in range(len(methods)):
+                method = methods[(turn + i) % len(methods)]
+                if queues.get(method) and not exhausted(method):
+                    turn = (turn + i + 1) % len(methods)
+                    return method, queues[method].pop(0)
+            return None
+
+        def collect(method, future):
+            nonlocal best
+            _, param, score, labels, bic, seconds = future.result()
+            done[method].append((param, score, labels, bic))
+            spent[method] += seconds
+            best = max(best, score)
+            stage_profiler.record(method, seconds)
+            if param is not None:
+                stage_profiler.record_item(method, f"{'n' if method == 'GMM' else 'k'}={param}", seconds)
+
+        executor = _new_pool(n_jobs, self.X, self.names)
+        running = {}  # future -> (method, param, deadline)
+        agglomerative_ready = "Agglomerative" not in methods
+        try:
+            while True:
+                kmeans_running = any(m == "KMeans" for m, _, _ in running.values())
+                if not (agglomerative_ready or kmeans_running or (queues.get("KMeans") and not exhausted("KMeans"))):
+                    agglomerative_ready = True
+                    kmeans = sorted(done.get("KMeans", []), key=lambda r: r[0])
+                    if kmeans:
+                        queues["Agglomerative"].append(max(kmeans, key=lambda r: r[1])[0])
+                while len(running) < n_jobs and (candidate := next_candidate()) is not None:
+                    method, param = candidate
+                    deadline = None if time_budget is None else time.monotonic() + time_budget - spent[method]
+                    running[executor.submit(_run_candidate, method, param)] = (method, param, deadline)
+                if not running:
+                    break
+
+                deadlines = [d for _, _, d in running.values() if d is not None]
+                timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(running.pop(future)[0], future)
+                now = time.monotonic()
+                overdue = [f for f, (_, _, d) in running.items() if d is not None and d <= now and not f.done()]
+                if not overdue:
+                    continue
+                for future in overdue:
+                    stopped.add(running.pop(future)[0])
+                _terminate_pool(executor)
+                for future, (method, param, _) in running.items():
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        collect(method, future)
+                    else:
+                        queues[method].insert(0, param)
+                running.clear()
+                executor = _new_pool(n_jobs, self.X, self.names)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        for method in methods:
+            runs = sorted(done[method], key=lambda r: r[0] or 0)  # ties go to the smallest k, as in run_all
+            if not runs:
+                if method != "Agglomerative" or method in stopped:  # run_all skips it when KMeans had no k
+                    self.results.append((method, None, -1, None))
+                continue
+            if method == "GMM":
+                param, score, labels, _ = min(runs, key=lambda r: r[3])
+            else:
+                param, score, labels, _ = max(runs, key=lambda r: r[1])
+            self.results.append((method, param, score, labels))
         return self.results
 
     def print_summary(self, pivot):
@@ -141,33 +431,73 @@ class ClusterAnalyzer:
             print(f"Method: {method}, Param: {param}, Silhouette: {score:.3f}")
             n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
             print(f"  Number of clusters: {n_clusters}")
-            top_products = []
-            df = pivot.copy()
-            df['cluster'] = labels
-            for cl, grp in df.groupby('cluster'):
-                top = grp.drop(columns='cluster').sum().sort_values(ascending=False).head(3)
-                top_products.append(f"Cluster {cl}: " + ", ".join(top.index))
+            cluster_costs = pivot.groupby(labels).sum()  # one groupby for all clusters
+            for cl, row in cluster_costs.iterrows():
+                print(f"    Cluster {cl}: " + ", ".join(row.sort_values(ascending=False).head(3).index))
             if score > best_score:
                 best, best_score = (method, labels), score
         if best:
             method, labels = best
             print(f"\nBest method: {method}, Silhouette score: {best_score:.3f}")
 
+def _same_result(a, b, atol):
+    """Two (method, param, score, labels) results with the same choice, silhouette and labels."""
+    if a[1] != b[1] or not np.isclose(a[2], b[2], rtol=0, atol=atol):
+        return False
+    return (a[3] is None and b[3] is None) or (a[3] is not None and b[3] is not None and np.array_equal(a[3], b[3]))
+
+
+def check_parallel_equivalence(X, names, n_jobs=None, methods=METHODS, atol=1e-9) -> dict:
+    """
+    Run run_all and run_parallel (no time budget, no early stop) on the same data
+    and compare every method's chosen parameter, silhouette and labels.
+    """
+    serial = {r[0]: r for r in ClusterAnalyzer(X, names).run_all(methods)}
+    parallel = {r[0]: r for r in ClusterAnalyzer(X, names).run_parallel(n_jobs, methods=methods)}
+    mismatches = [m for m in METHODS if (m in serial or m in parallel)
+                  and not (m in serial and m in parallel and _same_result(serial[m], parallel[m], atol))]
+    return {
+        'methods': list(serial),
+        'mismatches': mismatches,
+        'passed': not mismatches
+    }
+
 # ----------------- Main -----------------
-def main():
+def parse_args(argv=None):
+    parser = cli.base_parser("Compare clustering methods on the applications' cost profiles.", figures=False)
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    parser.add_argument("--parallel", action="store_true", help="evaluate the candidates on a process pool")
+    parser.add_argument("--n-jobs", type=int, help="pool size for --parallel (default: all cores)")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="--parallel: worker seconds per method")
+    parser.add_argument("--early-stop-margin", type=float, help="--parallel: see the notes on run_parallel")
+    parser.add_argument("--cache-dir", help="keep KMeans fits and silhouettes here between runs")
+    parser.add_argument("--check-parallel", action="store_true",
+                        help="only check that --parallel picks the same results as a serial run")
+    return cli.parse(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     applications = ["SalesPortal", "HRSystem", "PayrollApp", "InventoryMgmt", "CustomerPortal",
                     "AnalyticsDashboard", "EmailService", "DevOpsTooling", "KnowledgeBase", "ChatOps"]
     services = ["AWS Lambda", "Amazon API Gateway", "Amazon DynamoDB", "Amazon RDS",
                 "Amazon SNS", "Amazon SQS", "Amazon S3", "Amazon VPC",
                 "Amazon CloudWatch", "Amazon EC2", "Amazon ECS", "Amazon Redshift"]
 
-    df = DummyDataGenerator(applications, services).generate()
-    transformer = DataTransformer(df)
+    with stage_profiler.stage("generate"):
+        df = read_cost_rows(args.input) if args.input else DummyDataGenerator(applications, services).generate()
+    transformer = DataTransformer(CostMatrixCache.from_rows(df))
     pivot = transformer.pivot_data()
     X = transformer.scale_features()
 
-    analyzer = ClusterAnalyzer(X, pivot.index)
-    analyzer.run_all()
+    if args.check_parallel:
+        print(check_parallel_equivalence(X, pivot.index, args.n_jobs, args.methods))
+        return
+    analyzer = ClusterAnalyzer(X, pivot.index, cache_dir=args.cache_dir)
+    if args.parallel:
+        analyzer.run_parallel(args.n_jobs, args.time_budget, args.early_stop_margin, args.methods)
+    else:
+        analyzer.run_all(args.methods)
     analyzer.print_summary(pivot)
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+"""
+Memory and groupby time of object-string cost frames against CostFrame.
+
+    python benchmarks/bench_cost_frame.py --apps 2000 --products 50 --days 30
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import ROOT, load_fast_changing_groups
+
+sys.path.append(str(ROOT / "shared"))
+from cost_frame import CostFrame
+
+
+def synthetic_costs(n_apps, n_products, days, seed=42):
+    """Long cost table with Python-string names, as the scripts build it today."""
+    rng = np.random.default_rng(seed)
+    apps = np.array([f"App{i:05d}" for i in range(n_apps)], dtype=object)
+    products = np.array([f"Product{j:03d}" for j in range(n_products)], dtype=object)
+    n_rows = n_apps * n_products * days
+    return pd.DataFrame({
+        "application_name": np.repeat(apps, n_products * days),
+        "product_name": np.tile(np.repeat(products, days), n_apps),
+        "date": np.tile(pd.date_range("2023-01-01", periods=days, freq="D").to_numpy(), n_apps * n_products),
+        "eur_total_costs": rng.uniform(50, 500, n_rows),
+    }).astype({"application_name": object, "product_name": object})
+
+
+def timed(func, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--apps", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    clustering = load_fast_changing_groups()
+    df = synthetic_costs(args.apps, args.products, args.days)
+    frames = {
+        "object strings": df,
+        "CostFrame float64": CostFrame.from_pandas(df),
+        "CostFrame float32": CostFrame.from_pandas(df, cost_dtype=np.float32),
+    }
+
+    results = []
+    for name, frame in frames.items():
+        nbytes = frame.memory_usage(deep=True).sum() if isinstance(frame, pd.DataFrame) else frame.nbytes
+        pivot_seconds = timed(lambda: clustering.DataTransformer.pivot_costs(frame))
+        frame_df = frame if isinstance(frame, pd.DataFrame) else frame.to_pandas()
+        groupby_seconds = timed(lambda: frame_df.groupby(
+            ["application_name", "product_name"], observed=True)["eur_total_costs"].sum())
+        results.append({
+            "format": name,
+            "rows": len(df),
+            "memory_mb": round(nbytes / 2**20, 1),
+            "pivot_costs_seconds": round(pivot_seconds, 3),
+            "groupby_sum_seconds": round(groupby_seconds, 3),
+        })
+        print(f"{name:<18} {nbytes / 2**20:9.1f} MB | pivot_costs {pivot_seconds:7.3f}s "
+              f"| groupby sum {groupby_seconds:7.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Speed of the batched Holt-Winters engine against one statsmodels fit per series.
+
+statsmodels is timed on a small sample of series and extrapolated linearly to
+the full size, since fitting 100k series one by one takes hours.
+
+    python benchmarks/bench_holtwinters_batch.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import time
+import warnings
+
+import numpy as np
+
+from common import load_anomaly_detection
+
+
+def synthetic_series(n_series, days, seed=42):
+    """Same shape as DummyDataGenerator: base + seasonality + noise + spikes/drops."""
+    rng = np.random.default_rng(seed)
+    values = (rng.uniform(80, 120, (n_series, 1))
+              + 10 * np.sin(np.linspace(0, 3 * np.pi, days))
+              + rng.normal(0, 3, (n_series, days)))
+    spikes = rng.random((n_series, days)) < 0.25
+    values[spikes] += rng.choice([-1, 1], spikes.sum()) * rng.uniform(50, 150, spikes.sum())
+    return values
+
+
+def time_statsmodels(module, values, sample):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # the script only imports it when fitting
+    start = time.perf_counter()
+    for row in values[:sample]:
+        ExponentialSmoothing(
+            row, seasonal='add', seasonal_periods=module.SEASONAL_PERIODS, trend='add', initialization_method="estimated"
+        ).fit()
+    return (time.perf_counter() - start) / sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--statsmodels-sample", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    module = load_anomaly_detection()
+    warnings.simplefilter("ignore")
+    per_series = time_statsmodels(module, synthetic_series(args.statsmodels_sample, args.days), args.statsmodels_sample)
+
+    results = []
+    for n_series in args.sizes:
+        values = synthetic_series(n_series, args.days)
+        start = time.perf_counter()
+        module.fit_batch(values)
+        batch_seconds = time.perf_counter() - start
+        statsmodels_seconds = per_series * n_series
+        results.append({
+            "n_series": n_series,
+            "days": args.days,
+            "batch_seconds": round(batch_seconds, 3),
+            "statsmodels_seconds_extrapolated": round(statsmodels_seconds, 1),
+            "speedup": round(statsmodels_seconds / batch_seconds, 1),
+        })
+        print(f"{n_series:>8} series: batch {batch_seconds:8.2f}s | "
+              f"statsmodels ~{statsmodels_seconds:10.1f}s | speedup x{statsmodels_seconds / batch_seconds:.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
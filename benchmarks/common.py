@@ -0,0 +1,35 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+# ---------- Script locations ----------
+# The use-case folders are plain script directories (names with spaces, a
+# module name starting with a digit), so benchmarks load them by path.
+ROOT = Path(__file__).resolve().parents[1]
+ANOMALY_DIR = ROOT / "1.8m to time consuming for humans - Anomaly detection"
+CLUSTERING_DIR = ROOT / "Fast changing dimensions - Clustering"
+
+
+def load_script(path: Path, name: str):
+    """Import a script file as module `name`, with its folder on sys.path for sibling imports."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # registered first so worker processes can unpickle its functions
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_anomaly_detection():
+    return load_script(ANOMALY_DIR / "1.8million_worth_of_code.py", "anomaly_detection")
+
+
+def load_fast_changing_groups():
+    return load_script(CLUSTERING_DIR / "fast_changing_groups.py", "fast_changing_groups")
+
+
+def load_best_cluster():
+    return load_script(CLUSTERING_DIR / "what_is_the_best_cluster.py", "what_is_the_best_cluster")
@@ -0,0 +1,386 @@
+"""
+Benchmark suite for the anomaly detection and clustering hot paths.
+
+Every (case, size) runs in a fresh process, so wall time and peak RSS are not
+polluted by earlier cases. Results go to a JSON file that a later run can be
+compared against:
+
+    python benchmarks/run_benchmarks.py --sizes small medium --output results.json
+    python benchmarks/run_benchmarks.py --compare baseline.json results.json --tolerance 0.2
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # silhouette plots must not block the run
+
+from common import ROOT, load_anomaly_detection, load_best_cluster, load_fast_changing_groups
+
+# (applications, products, days) per size, per pipeline
+ANOMALY_SIZES = {"small": (20, 9, 120), "medium": (100, 20, 120), "large": (1000, 50, 365)}
+CLUSTERING_SIZES = {"small": (20, 12, 42), "medium": (2000, 12, 42), "large": (10000, 12, 42)}
+DEFAULT_SIZES = ["small", "medium"]
+DEFAULT_TOLERANCE = 0.2  # compare mode: flag cases more than 20% slower / bigger
+NOISE_FLOOR_SECONDS = 0.05  # compare mode: ignore timing changes smaller than this
+DEFAULT_CASE_TIMEOUT = 3600  # seconds before a case's process is killed and recorded as failed
+POLL_SECONDS = 1.0  # how often the runner checks that a case's process is still alive
+SILHOUETTE_K_RANGE = range(2, 10)
+
+
+class Stopwatch:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+# ---------- Cases ----------
+# Each case takes a size name and a Stopwatch and times its own stages.
+def _anomaly_case(engine):
+    def run(size, watch):
+        module = load_anomaly_detection()
+        apps, products, days = ANOMALY_SIZES[size]
+        with watch.stage("generate"):
+            df = module.DummyDataGenerator.at_scale(apps, products, days).generate()
+        with watch.stage("fit_residuals"):
+            residuals = module.fit_residuals(df, n_jobs=1, engine=engine)
+        with watch.stage("score_residuals"):
+            module.score_residuals(residuals)
+    return run
+
+
+def anomaly_store(size, watch):
+    module = load_anomaly_detection()
+    apps, products, days = ANOMALY_SIZES[size]
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(apps, products, days).generate()
+    with watch.stage("detect"):
+        anomalies = module.detect_anomalies_holtwinters(df, engine="batch")
+    with tempfile.TemporaryDirectory() as tmp:
+        with module.AnomalyScoreStore(os.path.join(tmp, "scores.sqlite")) as store:
+            with watch.stage("append"):
+                store.append(anomalies)
+            with watch.stage("heatmap_last_week"):
+                module.heatmap_last_week(store)
+            with watch.stage("rolling_summary"):
+                store.rolling_summary()
+
+
+def anomaly_service(size, watch):
+    module = load_anomaly_detection()
+    from anomaly_service import AnomalyService, run_load, serve  # siblings of the script, importable once it is loaded
+    apps, products, days = ANOMALY_SIZES[size]
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(apps, products, days).generate()
+    requests = [(app, product, group["date"].tolist(), group["eur_total_costs"].tolist())
+                for (app, product), group in df.groupby(["application_name", "product_name"], observed=True)]
+
+    async def load_test():
+        async with AnomalyService(module.fit_with_states) as service:
+            server = await serve(service)
+            host, port = server.sockets[0].getsockname()[:2]
+            # cold: every series is fitted; hot: the same checks again, answered from the model cache
+            for phase in ("cold", "hot"):
+                with watch.stage(f"{phase}_load"):
+                    latency = await run_load(host, port, requests)
+                watch.stages[f"{phase}_p50"] = latency["p50_ms"] / 1000
+                watch.stages[f"{phase}_p99"] = latency["p99_ms"] / 1000
+            server.close()
+            await server.wait_closed()
+
+    import asyncio
+    asyncio.run(load_test())
+
+
+def pivot_costs(size, watch):
+    module = load_fast_changing_groups()
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(*CLUSTERING_SIZES[size]).generate()
+    with watch.stage("pivot_costs"):
+        pivot = module.DataTransformer.pivot_costs(df)
+    with watch.stage("normalize_to_percentage"):
+        module.DataTransformer.normalize_to_percentage(pivot)
+
+
+def cost_matrix_update(size, watch):
+    module = load_fast_changing_groups()
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(*CLUSTERING_SIZES[size]).generate()
+    delta = df.iloc[:max(1, len(df) // 100)]  # a day's worth of changed rows
+    with watch.stage("build"):
+        matrix = module.CostMatrixCache.from_rows(df)
+    with watch.stage("update_and_views"):
+        matrix.update(delta)
+        module.DataTransformer.pivot_costs(matrix)
+        module.DataTransformer.normalize_to_percentage(matrix)
+
+
+def _clustering_inputs(module, size, watch):
+    apps, services, days = CLUSTERING_SIZES[size]
+    generator = module.DummyDataGenerator.at_scale(apps, services, days)
+    with watch.stage("generate"):
+        df = generator.generate()
+    with watch.stage("pivot_costs"):
+        pivot = module.DataTransformer.pivot_costs(df)
+        pivot_pct = module.DataTransformer.normalize_to_percentage(pivot)
+    return generator.services, pivot, pivot_pct
+
+
+def cluster_by_usage_pattern(size, watch):
+    module = load_fast_changing_groups()
+    services, pivot, pivot_pct = _clustering_inputs(module, size, watch)
+    with watch.stage("cluster_by_usage_pattern"):
+        module.ClusterAnalyzer(large_scale=False).cluster_by_usage_pattern(pivot, pivot_pct, products=services)
+
+
+def cluster_large_scale(size, watch):
+    module = load_fast_changing_groups()
+    services, pivot, pivot_pct = _clustering_inputs(module, size, watch)
+    analyzer = module.ClusterAnalyzer(large_scale=True)
+    with watch.stage("cluster_by_usage_pattern"):
+        pivot, X_usage = analyzer.cluster_by_usage_pattern(pivot, pivot_pct, products=services)
+    with watch.stage("silhouette_analysis"):
+        analyzer.silhouette_analysis(X_usage, SILHOUETTE_K_RANGE, "benchmark")
+
+
+def silhouette_analysis(size, watch):
+    module = load_fast_changing_groups()
+    _, pivot, _ = _clustering_inputs(module, size, watch)
+    analyzer = module.ClusterAnalyzer(large_scale=False)
+    with watch.stage("cluster_by_total_cost"):
+        pivot, X_cost = analyzer.cluster_by_total_cost(pivot)
+    with watch.stage("silhouette_analysis"):
+        analyzer.silhouette_analysis(X_cost, SILHOUETTE_K_RANGE, "benchmark")
+
+
+def best_cluster_run_all(size, watch):
+    module = load_best_cluster()
+    apps, services, days = CLUSTERING_SIZES[size]
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(apps, services, days).generate()
+    transformer = module.DataTransformer(df)
+    with watch.stage("pivot_data"):
+        pivot = transformer.pivot_data()
+    with watch.stage("scale_features"):
+        X = transformer.scale_features()
+    with watch.stage("run_all"):
+        module.ClusterAnalyzer(X, pivot.index).run_all()
+
+
+def best_cluster_run_parallel(size, watch):
+    module = load_best_cluster()
+    apps, services, days = CLUSTERING_SIZES[size]
+    with watch.stage("generate"):
+        df = module.DummyDataGenerator.at_scale(apps, services, days).generate()
+    transformer = module.DataTransformer(df)
+    with watch.stage("pivot_data"):
+        pivot = transformer.pivot_data()
+    with watch.stage("scale_features"):
+        X = transformer.scale_features()
+    with watch.stage("run_parallel"):
+        module.ClusterAnalyzer(X, pivot.index).run_parallel()
+
+
+def _import_case(load, deferred=()):
+    """
+    Startup cost of a script: its import (libraries first, then the script) and,
+    separately, the heavy modules it only loads when a feature needs them. The
+    size is ignored.
+    """
+    def run(size, watch):
+        with watch.stage("import_numpy_pandas"):
+            import numpy, pandas  # noqa: F401
+        with watch.stage("import_script"):
+            load()
+        with watch.stage("deferred_imports"):
+            for name in deferred:
+                importlib.import_module(name)
+    return run
+
+
+CASES = {
+    "import.anomaly_detection": _import_case(load_anomaly_detection,
+                                             ("statsmodels.tsa.holtwinters", "matplotlib.pyplot", "seaborn")),
+    "import.fast_changing_groups": _import_case(load_fast_changing_groups, ("matplotlib.pyplot",)),
+    "import.best_cluster": _import_case(load_best_cluster, ("networkx",)),
+    "anomaly.detect.statsmodels": _anomaly_case("statsmodels"),
+    "anomaly.detect.batch": _anomaly_case("batch"),
+    "anomaly.store": anomaly_store,
+    "anomaly.service": anomaly_service,
+    "clustering.pivot_costs": pivot_costs,
+    "clustering.cost_matrix_update": cost_matrix_update,
+    "clustering.cluster_by_usage_pattern": cluster_by_usage_pattern,
+    "clustering.silhouette_analysis": silhouette_analysis,
+    "clustering.large_scale": cluster_large_scale,
+    "best_cluster.run_all": best_cluster_run_all,
+    "best_cluster.run_parallel": best_cluster_run_parallel,
+}
+
+
+# ---------- Runner ----------
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak RSS of this process, or with RUSAGE_CHILDREN of its largest finished worker process."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB on Linux
+
+
+def _run_in_child(case, size, queue):
+    import warnings
+    warnings.simplefilter("ignore")
+    if "fork" in multiprocessing.get_all_start_methods():
+        # the scripts are loaded by path (common.load_script): forked pool workers
+        # inherit them, workers spawned like this child could not import them
+        multiprocessing.set_start_method("fork", force=True)
+    watch = Stopwatch()
+    start = time.perf_counter()
+    error = None
+    try:
+        CASES[case](size, watch)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    queue.put({
+        "wall_seconds": time.perf_counter() - start,
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_worker_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),  # pools: n_jobs, run_parallel, service
+        "stages": watch.stages,
+        "error": error,
+    })
+
+
+def _exit_reason(exitcode):
+    if exitcode is not None and exitcode < 0:
+        return f"killed by {signal.Signals(-exitcode).name}"  # SIGKILL: usually the OOM killer
+    return f"exited with code {exitcode}"
+
+
+def _wait_for_result(process, results, timeout):
+    """The child's result, or a failed result when it dies or runs past `timeout` seconds."""
+    start = time.perf_counter()
+    while True:
+        try:
+            return results.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            try:  # it may have put its result just before exiting
+                return results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                error = f"process {_exit_reason(process.exitcode)}"
+                break
+        if timeout is not None and time.perf_counter() - start > timeout:
+            process.kill()
+            error = f"timed out after {timeout}s"
+            break
+    return {"wall_seconds": time.perf_counter() - start, "peak_rss_mb": None, "peak_worker_rss_mb": None,
+            "stages": {}, "error": error}
+
+
+def run_case(case, size, timeout=DEFAULT_CASE_TIMEOUT):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_in_child, args=(case, size, results))
+    process.start()
+    result = _wait_for_result(process, results, timeout)
+    process.join()
+    sizes = ANOMALY_SIZES if case.startswith("anomaly") else CLUSTERING_SIZES
+    return {"case": case, "size": size, "apps_products_days": sizes[size], **result}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(cases, sizes, timeout=DEFAULT_CASE_TIMEOUT):
+    results = []
+    for case in cases:
+        for size in sizes:
+            result = run_case(case, size, timeout)
+            results.append(result)
+            status = result["error"] or f"{result['peak_rss_mb']:8.0f} MB peak RSS"
+            print(f"{case:<38} {size:<7} {result['wall_seconds']:9.2f}s  {status}")
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+# ---------- Compare ----------
+def compare(baseline, candidate, tolerance=DEFAULT_TOLERANCE):
+    """Return the (case, size, metric, old, new) rows that grew by more than `tolerance`."""
+    previous = {(r["case"], r["size"]): r for r in baseline["results"] if not r["error"]}
+    regressions = []
+    for result in candidate["results"]:
+        old = previous.get((result["case"], result["size"]))
+        if old is None or result["error"]:
+            continue
+        metrics = [("wall_seconds", old["wall_seconds"], result["wall_seconds"]),
+                   ("peak_rss_mb", old["peak_rss_mb"], result["peak_rss_mb"]),
+                   ("peak_worker_rss_mb", old.get("peak_worker_rss_mb"), result.get("peak_worker_rss_mb"))]
+        metrics += [(f"stage:{name}", old["stages"].get(name), seconds)
+                    for name, seconds in result["stages"].items()]
+        for metric, before, after in metrics:
+            if not metric.endswith("rss_mb") and before is not None and after - before < NOISE_FLOOR_SECONDS:
+                continue
+            if before and after > before * (1 + tolerance):
+                regressions.append((result["case"], result["size"], metric, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", choices=list(ANOMALY_SIZES), default=DEFAULT_SIZES)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two results files instead of running the suite")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_CASE_TIMEOUT,
+                        help="seconds per case before its process is killed")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.tolerance)
+        for case, size, metric, before, after in regressions:
+            print(f"REGRESSION {case} [{size}] {metric}: {before:.3f} -> {after:.3f} (x{after / before:.2f})")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    report = run_suite(args.cases, args.sizes, args.timeout)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
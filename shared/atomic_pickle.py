@@ -0,0 +1,16 @@
+import os
+import pickle
+
+# ---------- Atomic pickle files ----------
+# State stores and caches are pickled to a temporary file next to their target
+# and moved over it with os.replace, so an interrupted write never leaves a
+# half-written file behind: readers see either the old or the new contents.
+
+
+def dump(obj, path):
+    """Pickle `obj` to `path` atomically, creating its directory if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
@@ -0,0 +1,33 @@
+import argparse
+
+import stage_profiler
+from report_rendering import REPORT_DIR_ENV, report_dir
+from stage_profiler import PROFILE_ENV
+
+# ---------- Command-line entry points ----------
+# Every script's main(argv) parses its own options on top of the shared ones
+# below. Without arguments a script runs on its generated dummy data, as it
+# always did; the environment variables still work when no option is given.
+
+
+def base_parser(description, figures=True) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--input", metavar="PATH",
+                        help="cost rows (.csv, .parquet or a directory of Parquet parts) instead of dummy data")
+    parser.add_argument("--profile", metavar="PATH", help=f"write per-stage timings (.json / .csv), as {PROFILE_ENV}")
+    if figures:
+        parser.add_argument("--report-dir", metavar="DIR",
+                            help=f"write figures to DIR instead of showing them, as {REPORT_DIR_ENV}")
+    return parser
+
+
+def parse(parser: argparse.ArgumentParser, argv=None) -> argparse.Namespace:
+    """Parse argv, start the profiler if asked and resolve --report-dir against the environment."""
+    args = parser.parse_args(argv)
+    if args.profile:
+        stage_profiler.enable_report(args.profile)
+    else:
+        stage_profiler.enable_from_env()
+    if "report_dir" in args:
+        args.report_dir = args.report_dir or report_dir()
+    return args
@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# ---------- Compact cost frame ----------
+# The cost tables of all use cases share the same shape: application, product,
+# (date), cost. Stored as Python strings the two name columns dominate memory
+# and every groupby / pivot_table hashes them again. CostFrame keeps them as
+# integer codes into a sorted list of names, so sums per application × product
+# are a single np.bincount and the names are only materialized for output.
+APPLICATION = "application_name"
+PRODUCT = "product_name"
+DATE = "date"
+COST = "eur_total_costs"
+
+
+class CostFrame:
+    def __init__(self, app_codes, product_codes, costs, applications, products, dates=None):
+        self.app_codes = np.asarray(app_codes)
+        self.product_codes = np.asarray(product_codes)
+        self.costs = np.asarray(costs)
+        self.applications = pd.Index(applications, name=APPLICATION)
+        self.products = pd.Index(products, name=PRODUCT)
+        self.dates = None if dates is None else np.asarray(dates)
+
+    @classmethod
+    def from_pandas(cls, df: pd.DataFrame, cost_dtype=np.float64):
+        """
+        Encode a long cost DataFrame. Categorical name columns are reused as-is;
+        cost_dtype=np.float32 halves the cost column when cents are precision enough.
+        """
+        apps = pd.Categorical(df[APPLICATION])
+        products = pd.Categorical(df[PRODUCT])
+        dates = pd.to_datetime(df[DATE]).to_numpy() if DATE in df.columns else None
+        return cls(
+            apps.codes, products.codes, df[COST].to_numpy(dtype=cost_dtype),
+            apps.categories, products.categories, dates
+        )
+
+    def __len__(self):
+        return len(self.costs)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.app_codes, self.product_codes, self.costs]
+        if self.dates is not None:
+            arrays.append(self.dates)
+        names = self.applications.memory_usage(deep=True) + self.products.memory_usage(deep=True)
+        return sum(a.nbytes for a in arrays) + names
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Long DataFrame with categorical name columns (no per-row strings)."""
+        columns = {
+            APPLICATION: pd.Categorical.from_codes(self.app_codes, categories=self.applications),
+            PRODUCT: pd.Categorical.from_codes(self.product_codes, categories=self.products),
+        }
+        if self.dates is not None:
+            columns[DATE] = self.dates
+        columns[COST] = self.costs
+        return pd.DataFrame(columns)
+
+    def sum_matrix(self) -> np.ndarray:
+        """Summed cost per (application, product) as a dense float64 matrix."""
+        n_products = len(self.products)
+        flat = self.app_codes.astype(np.int64) * n_products + self.product_codes
+        sums = np.bincount(flat, weights=self.costs, minlength=len(self.applications) * n_products)
+        return sums.reshape(len(self.applications), n_products)
+
+    def pivot(self) -> pd.DataFrame:
+        """Same result as pivot_table(index=application, columns=product, aggfunc="sum", fill_value=0)."""
+        return pd.DataFrame(self.sum_matrix(), index=self.applications, columns=self.products)
+
+    # ---------- Parquet / Arrow ----------
+    # Categorical columns are written as dictionary-encoded Arrow columns, so the
+    # names are stored once per file and read back as categoricals.
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.Table.from_pandas(self.to_pandas(), preserve_index=False)
+
+    @classmethod
+    def from_arrow(cls, table):
+        return cls.from_pandas(table.to_pandas(), cost_dtype=table.schema.field(COST).type.to_pandas_dtype())
+
+    def write_parquet(self, path):
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
+
+    @classmethod
+    def read_parquet(cls, path):
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
+
+
+def write_parquet_parts(frames, directory, prefix="part"):
+    """Write an iterable of CostFrames as numbered Parquet files; returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, frame in enumerate(frames):
+        path = os.path.join(directory, f"{prefix}-{i:05d}.parquet")
+        frame.write_parquet(path)
+        paths.append(path)
+    return paths
+
+
+def read_cost_rows(path) -> CostFrame:
+    """Cost rows from a .csv file, a .parquet file or a directory of Parquet parts."""
+    if str(path).endswith(".csv"):
+        return CostFrame.from_pandas(pd.read_csv(path))
+    return CostFrame.read_parquet(path)
+
+
+# ---------- Incremental cost matrix ----------
+# The clustering scripts only ever need the application × product sums and a
+# few views of them. CostMatrixCache keeps the sums as a dense matrix (rows and
+# columns sorted by name, like pivot_table) and adds new raw rows into it; the
+# views are computed once per state and served from memory until the next
+# update.
+class CostMatrixCache:
+    def __init__(self):
+        self.applications = pd.Index([], name=APPLICATION)
+        self.products = pd.Index([], name=PRODUCT)
+        self.sums = np.zeros((0, 0))
+        self._views = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls().update(rows)
+
+    def update(self, rows):
+        """Add a long DataFrame or CostFrame of cost rows; new names add rows / columns."""
+        frame = rows if isinstance(rows, CostFrame) else CostFrame.from_pandas(rows)
+        applications = self.applications.union(frame.applications)
+        products = self.products.union(frame.products)
+        if not (applications.equals(self.applications) and products.equals(self.products)):
+            grown = np.zeros((len(applications), len(products)))
+            grown[np.ix_(applications.get_indexer(self.applications), products.get_indexer(self.products))] = self.sums
+            self.sums, self.applications, self.products = grown, applications, products
+        app_codes = applications.get_indexer(frame.applications)[frame.app_codes]
+        product_codes = products.get_indexer(frame.products)[frame.product_codes]
+        flat = app_codes.astype(np.int64) * len(products) + product_codes
+        self.sums += np.bincount(flat, weights=frame.costs, minlength=self.sums.size).reshape(self.sums.shape)
+        self._views.clear()
+        return self
+
+    def _view(self, name, compute):
+        if name not in self._views:
+            self._views[name] = compute()
+        return self._views[name]
+
+    def pivot(self) -> pd.DataFrame:
+        """Same result as pivot_table(index=application, columns=product, aggfunc="sum", fill_value=0)."""
+        return self._view("pivot", lambda: pd.DataFrame(self.sums, index=self.applications, columns=self.products))
+
+    def totals(self) -> pd.Series:
+        return self._view("totals", lambda: self.pivot().sum(axis=1))
+
+    def percentages(self) -> pd.DataFrame:
+        """Each application's costs as % of its total (0 for applications without costs)."""
+        return self._view("percentages", lambda: self.pivot().div(self.totals(), axis=0).fillna(0) * 100)
+
+    def scaled(self) -> np.ndarray:
+        """The sums with every product column standardized (sklearn StandardScaler)."""
+        from sklearn.preprocessing import StandardScaler
+        # scaled from the pivot's (column-major) values: bit for bit the result of scaling pivot_table output
+        return self._view("scaled", lambda: StandardScaler().fit_transform(self.pivot().values))
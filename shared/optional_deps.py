@@ -0,0 +1,23 @@
+import importlib
+import importlib.util
+
+# ---------- Optional dependencies ----------
+# Features backed by a package that may not be installed (hdbscan,
+# python-louvain, ...) check for it with `available`: the import system is
+# asked whether the module can be found, without importing it, and the answer
+# is kept for the rest of the process. `load` imports the module on first use.
+_found = {}
+
+
+def available(name) -> bool:
+    if name not in _found:
+        try:
+            _found[name] = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):  # a missing parent package of a dotted name
+            _found[name] = False
+    return _found[name]
+
+
+def load(name):
+    """The imported module `name`, or None when it is not installed."""
+    return importlib.import_module(name) if available(name) else None
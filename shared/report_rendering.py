@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# ---------- Report rendering ----------
+# matplotlib and seaborn are imported by the first function that draws, not by
+# the scripts, so data-only runs never load them. Headless rendering selects the
+# Agg backend and writes PNG / SVG files instead of opening windows. Batches of
+# heatmaps are split over worker processes, and every worker draws all of its
+# heatmaps on one reused Figure.
+REPORT_DIR_ENV = "COST_REPORT_DIR"  # write figures here instead of showing them
+FIGURE_FORMATS = ("png", "svg")
+
+
+def report_dir():
+    """Directory from COST_REPORT_DIR, or None for interactive windows."""
+    return os.environ.get(REPORT_DIR_ENV) or None
+
+
+def pyplot(headless=False):
+    import matplotlib
+    if headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def save_figure(fig, path):
+    if not str(path).endswith(tuple(f".{fmt}" for fmt in FIGURE_FORMATS)):
+        raise ValueError(f"Figure path {path!r} must end in one of {FIGURE_FORMATS}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.savefig(path)
+    return path
+
+
+def draw_heatmap(fig, data, title, xlabel=None, ylabel=None, **heatmap_kwargs):
+    """Draw a seaborn heatmap of `data` on `fig`, replacing whatever it showed before."""
+    import seaborn as sns
+    fig.clf()
+    ax = fig.add_subplot()
+    sns.heatmap(data, ax=ax, **heatmap_kwargs)
+    ax.set_title(title, fontsize=16)
+    ax.set_xlabel(xlabel or "", fontsize=12)
+    ax.set_ylabel(ylabel or "", fontsize=12)
+    ax.tick_params(axis="y", labelrotation=0)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+def _render_heatmap_batch(jobs, out_dir, file_format, figsize, style):
+    plt = pyplot(headless=True)
+    fig = plt.figure(figsize=figsize)
+    try:
+        return [save_figure(draw_heatmap(fig, data, title, **style), os.path.join(out_dir, f"{name}.{file_format}"))
+                for name, data, title in jobs]
+    finally:
+        plt.close(fig)
+
+
+def render_heatmaps(jobs, out_dir, file_format="png", n_jobs=1, figsize=(16, 10), **style):
+    """
+    Write one heatmap file per (name, data, title) job to out_dir without a
+    display; `style` is passed on to draw_heatmap. Returns the paths in job order.
+    """
+    jobs = list(jobs)
+    if file_format not in FIGURE_FORMATS:
+        raise ValueError(f"Unknown figure format {file_format!r}, expected one of {FIGURE_FORMATS}")
+    if n_jobs == 1 or len(jobs) <= 1:
+        return _render_heatmap_batch(jobs, out_dir, file_format, figsize, style)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+    batches = [jobs[i::n_jobs] for i in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        rendered = list(executor.map(_render_heatmap_batch, batches, [out_dir] * n_jobs, [file_format] * n_jobs,
+                                     [figsize] * n_jobs, [style] * n_jobs))
+    paths = {}
+    for batch, batch_paths in zip(batches, rendered):
+        paths.update(zip((name for name, _, _ in batch), batch_paths))
+    return [paths[name] for name, _, _ in jobs]
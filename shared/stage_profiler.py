@@ -0,0 +1,132 @@
+import atexit
+import csv
+import heapq
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# ---------- Opt-in stage profiler ----------
+# The pipelines wrap their named stages in `stage("...")` and report single
+# expensive items (one series, one k) with `record_item`. Nothing is measured
+# until `enable()` is called (or COST_PROFILE is set, see `enable_from_env`):
+# while disabled, `stage` hands back one shared no-op context manager and
+# `record_item` returns immediately, so the hooks cost a function call.
+PROFILE_ENV = "COST_PROFILE"  # path of the report to write at exit, .json or .csv
+DEFAULT_TOP_N = 10  # slowest items kept per stage
+
+_NO_OP = nullcontext()
+_active = None
+
+
+def _rss_bytes():
+    """Current resident set size (Linux); 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class StageProfiler:
+    def __init__(self, top_n=DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.stages = {}  # name -> [calls, seconds, memory delta in bytes]
+        self.slowest = {}  # name -> min-heap of (seconds, item)
+
+    @contextmanager
+    def stage(self, name):
+        rss = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, memory_delta=_rss_bytes() - rss)
+
+    def record(self, name, seconds, calls=1, memory_delta=0):
+        totals = self.stages.setdefault(name, [0, 0.0, 0])
+        totals[0] += calls
+        totals[1] += seconds
+        totals[2] += memory_delta
+
+    def record_item(self, name, item, seconds):
+        heap = self.slowest.setdefault(name, [])
+        entry = (seconds, str(item))
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def report(self) -> dict:
+        return {
+            "stages": [
+                {"stage": name, "calls": calls, "seconds": round(seconds, 6),
+                 "memory_delta_mb": round(memory / 2**20, 3)}
+                for name, (calls, seconds, memory) in sorted(self.stages.items(), key=lambda s: -s[1][1])
+            ],
+            "slowest_items": {
+                name: [{"item": item, "seconds": round(seconds, 6)} for seconds, item in sorted(heap, reverse=True)]
+                for name, heap in self.slowest.items()
+            },
+        }
+
+    def write(self, path):
+        """Write the report as JSON, or as CSV when `path` ends in .csv."""
+        report = self.report()
+        if not str(path).endswith(".csv"):
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            return
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "stage", "item", "calls", "seconds", "memory_delta_mb"])
+            for row in report["stages"]:
+                writer.writerow(["stage", row["stage"], "", row["calls"], row["seconds"], row["memory_delta_mb"]])
+            for name, items in report["slowest_items"].items():
+                for row in items:
+                    writer.writerow(["item", name, row["item"], 1, row["seconds"], ""])
+
+
+def enable(top_n=DEFAULT_TOP_N) -> StageProfiler:
+    global _active
+    _active = StageProfiler(top_n)
+    return _active
+
+
+def disable():
+    """Stop profiling and return the profiler that was active (or None)."""
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    return _NO_OP if _active is None else _active.stage(name)
+
+
+def record_item(name, item, seconds):
+    if _active is not None:
+        _active.record_item(name, item, seconds)
+
+
+def record(name, seconds, calls=1):
+    if _active is not None:
+        _active.record(name, seconds, calls)
+
+
+def enable_report(path):
+    """Enable profiling and write the report to `path` at exit (once per process)."""
+    if not path or _active is not None:
+        return _active
+    profiler = enable()
+    atexit.register(profiler.write, path)
+    return profiler
+
+
+def enable_from_env():
+    """Enable profiling when COST_PROFILE is set and write the report there at exit."""
+    return enable_report(os.environ.get(PROFILE_ENV))